@@ -19,7 +19,9 @@ import path from "path";
 import { useDebouncedCallback } from "use-debounce";
 import { useEventSourceNullOk } from "~/event-source";
 import { handleRedirectResponse } from "~/handleRedirect";
+import type { TreeNode } from "~/renderer";
 import { applyFormDataTransforms, RenderedChildren } from "~/renderer";
+import { applyTreePatches, TreePatch } from "~/treePatch";
 
 import { gooeyGuiRouteHeader } from "~/consts";
 import appStyles from "~/styles/app.css";
@@ -121,37 +123,102 @@ export const shouldRevalidate: ShouldRevalidateFunction = (args) => {
 
 function useRealtimeChannels({
   channels,
+  realtimeUrl,
 }: {
   channels: string[] | undefined | null;
+  realtimeUrl?: string;
 }) {
   let url;
   if (channels && channels.length) {
     const params = new URLSearchParams(
       channels.map((name) => ["channels", name])
     );
-    url = `/__/realtime/?${params}`;
+    // the python server's endpoint (if mounted) shares one redis connection for all tabs
+    url = `${realtimeUrl ?? "/__/realtime/"}?${params}`;
   }
   return useEventSourceNullOk(url);
 }
 
+// true if the client has already rendered all the channel versions in a realtime event
+function isRenderedEvent(
+  event: string,
+  renderedVersions: Record<string, number> | undefined
+): boolean {
+  if (!renderedVersions) return false;
+  let versions: Record<string, number | null>;
+  try {
+    versions = JSON.parse(event).versions;
+  } catch (e) {
+    return false;
+  }
+  if (!versions) return false;
+  return Object.entries(versions).every(([channel, version]) => {
+    const rendered = renderedVersions[channel];
+    // a channel with no value, that the last render didn't see a value for either
+    if (version == null) return rendered == null;
+    return rendered != null && version <= rendered;
+  });
+}
+
 export type OnChange = (event?: {
   target: EventTarget | HTMLElement | null | undefined;
   currentTarget?: EventTarget | HTMLElement | null | undefined;
 }) => void;
 
+// shared, so that effects depending on the state don't re-fire on every render
+const EMPTY_STATE: Record<string, any> = {};
+
 function base64Decode(base64EncodedString: string): string {
   return new TextDecoder().decode(
     Uint8Array.from(atob(base64EncodedString), (m) => m.charCodeAt(0))
   );
 }
 
+function useRenderTree({
+  children,
+  patches,
+  tree_version,
+  base_tree_version,
+}: {
+  children?: Array<TreeNode>;
+  patches?: Array<TreePatch>;
+  tree_version?: string;
+  base_tree_version?: string;
+}) {
+  const treeRef = useRef<{ version?: string; children?: Array<TreeNode> }>(
+    {}
+  );
+  const prev = treeRef.current;
+  if (tree_version && prev.version === tree_version) {
+    return { children: prev.children, treeRef, isStale: false };
+  }
+  if (patches) {
+    if (!prev.children || prev.version !== base_tree_version) {
+      // e.g. after a navigation race or an HMR reset, the patches don't apply to what we have.
+      // keep showing the old tree until the full one is fetched
+      return { children: prev.children, treeRef, isStale: true };
+    }
+    children = applyTreePatches(prev.children, patches);
+  }
+  treeRef.current = { version: tree_version, children };
+  return { children, treeRef, isStale: false };
+}
+
 function App() {
   const [searchParams] = useSearchParams();
   const loaderData = useLoaderData<typeof loader>();
   const actionData = useActionData<typeof action>();
-  const { base64Body, children, state, channels } = actionData ?? loaderData;
+  const data = actionData ?? loaderData;
+  const { base64Body, channels, channel_versions, realtime_url, state_token } =
+    data;
+  // with server-side session state, this only holds the values of the rendered widgets
+  const state = data.state ?? EMPTY_STATE;
+  const { children, treeRef, isStale } = useRenderTree(data);
   const formRef = useRef<HTMLFormElement>(null);
-  const realtimeEvent = useRealtimeChannels({ channels });
+  const realtimeEvent = useRealtimeChannels({
+    channels,
+    realtimeUrl: realtime_url,
+  });
   const fetcher = useFetcher();
   const submit = useSubmit();
   const navigate = useNavigate();
@@ -165,7 +232,13 @@ function App() {
   }, [base64Body]);
 
   useEffect(() => {
-    if (realtimeEvent && fetcher.state === "idle" && formRef.current) {
+    if (
+      realtimeEvent &&
+      fetcher.state === "idle" &&
+      formRef.current &&
+      // e.g. duplicate publishes, or the refresh on (re)connect
+      !isRenderedEvent(realtimeEvent, channel_versions)
+    ) {
       onSubmit();
     }
   }, [fetcher.state, realtimeEvent, submit]);
@@ -235,22 +308,38 @@ function App() {
       }
     }
     applyFormDataTransforms({ children, formData });
-    let body = { state: { ...state, ...formData } };
+    let body = {
+      state: { ...state, ...formData },
+      tree_version: treeRef.current.version,
+      state_token,
+    };
     submit(body, submitOptions);
   };
 
+  useEffect(() => {
+    if (!isStale) return;
+    // without a tree_version, the server sends the full tree
+    submit({ state, state_token }, submitOptions);
+  }, [isStale, data]);
+
   let globalContext = {
     navigate,
     session_state: state,
     update_session_state(newState: Record<string, any>) {
       Object.assign(state, newState);
-      submit({ state }, submitOptions);
+      submit(
+        { state, tree_version: treeRef.current.version, state_token },
+        submitOptions
+      );
     },
     set_session_state(newState: Record<string, any>) {
       for (let key in state) {
         state[key] = newState[key];
       }
-      submit({ state }, submitOptions);
+      submit(
+        { state, tree_version: treeRef.current.version, state_token },
+        submitOptions
+      );
     },
     rerun: onSubmit,
   };
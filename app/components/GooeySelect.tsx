@@ -8,6 +8,7 @@ import type {
   MenuProps,
 } from "react-select";
 import Select, { components } from "react-select";
+import AsyncSelect from "react-select/async";
 import { InputLabel } from "~/gooeyInput";
 import { useJsonFormInput } from "~/jsonFormInput";
 import { ClientOnlySuspense } from "~/lazyImports";
@@ -22,8 +23,16 @@ export default function GooeySelect({
   onChange: () => void;
   state: Record<string, any>;
 }) {
-  let { defaultValue, name, label, styles, help, tooltipPlacement, ...args } =
-    props;
+  let {
+    defaultValue,
+    name,
+    label,
+    styles,
+    help,
+    tooltipPlacement,
+    optionsUrl,
+    ...args
+  } = props;
   let [JsonFormInput, value, setValue] = useJsonFormInput({
     defaultValue,
     name,
@@ -43,15 +52,45 @@ export default function GooeySelect({
     onChange();
   };
 
-  let selectValue = args.options.filter((opt: any) =>
-    args.isMulti ? value.includes(opt.value) : opt.value === value
-  );
+  // labels of the options fetched from optionsUrl, by their encoded value
+  const knownOptions = useRef(new Map<string, any>());
+  let selectValue;
+  if (optionsUrl) {
+    for (const opt of args.options) {
+      knownOptions.current.set(JSON.stringify(opt.value), opt);
+    }
+    selectValue = (args.isMulti ? value : [value])
+      .filter((it: any) => it !== null && it !== undefined)
+      .map(
+        (it: any) =>
+          knownOptions.current.get(JSON.stringify(it)) ?? {
+            value: it,
+            label: `${it}`,
+          }
+      );
+  } else {
+    selectValue = args.options.filter((opt: any) =>
+      args.isMulti ? value.includes(opt.value) : opt.value === value
+    );
+  }
   // if selectedValue is not in options, then set it to the first option
   useEffect(() => {
+    if (optionsUrl) return;
     if (!selectValue.length && !args.allow_none) {
       setValue(args.isMulti ? [args.options[0].value] : args.options[0].value);
     }
-  }, [args.isMulti, args.options, selectValue, setValue]);
+  }, [args.isMulti, args.options, selectValue, setValue, optionsUrl]);
+
+  let loadOptions = async (inputValue: string) => {
+    const params = new URLSearchParams({ q: inputValue, limit: "100" });
+    const response = await fetch(`${optionsUrl}?${params}`);
+    if (!response.ok) return [];
+    const data = await response.json();
+    for (const opt of data.options) {
+      knownOptions.current.set(JSON.stringify(opt.value), opt);
+    }
+    return data.options;
+  };
 
   styles = {
     ...styles,
@@ -98,18 +137,17 @@ export default function GooeySelect({
           </select>
         }
       >
-        {() => (
-          <Select
-            value={selectValue[0]?.value ? selectValue : null}
-            onChange={onSelectChange}
-            components={{
+        {() => {
+          const selectProps = {
+            onChange: onSelectChange,
+            components: {
               Option,
               SingleValue,
               MultiValueLabel,
               Placeholder,
               Menu,
-            }}
-            styles={{
+            },
+            styles: {
               ...Object.fromEntries(
                 Object.entries(styles ?? {}).map(([key, style]) => {
                   if (!style) return [key, undefined];
@@ -119,11 +157,30 @@ export default function GooeySelect({
                   ];
                 })
               ),
-            }}
-            placeholder={selectValue[0]?.label}
-            {...args}
-          />
-        )}
+            },
+            placeholder: selectValue[0]?.label,
+          };
+          if (optionsUrl) {
+            const { options, ...asyncArgs } = args;
+            return (
+              <AsyncSelect
+                value={selectValue.length ? selectValue : null}
+                loadOptions={loadOptions}
+                defaultOptions
+                cacheOptions={optionsUrl}
+                {...selectProps}
+                {...asyncArgs}
+              />
+            );
+          }
+          return (
+            <Select
+              value={selectValue[0]?.value ? selectValue : null}
+              {...selectProps}
+              {...args}
+            />
+          );
+        }}
       </ClientOnlySuspense>
     </div>
   );
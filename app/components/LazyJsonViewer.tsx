@@ -0,0 +1,113 @@
+import { useEffect, useMemo, useRef, useState } from "react";
+import type { ComponentProps } from "react";
+import { JsonViewer, defineDataType } from "@textea/json-viewer";
+
+// must match JSON_REF_KEY in lazy_json.py
+const REF_KEY = "__gui_json_ref__";
+
+type JsonRef = {
+  path: Array<string | number>;
+  offset: number;
+  preview: string;
+  size: number;
+};
+
+type Path = Array<string | number>;
+
+function isRef(value: any): boolean {
+  return (
+    typeof value === "object" &&
+    value !== null &&
+    !Array.isArray(value) &&
+    REF_KEY in value
+  );
+}
+
+// a json viewer for values that the server sent in parts, see `gui.json()`
+export default function LazyJsonViewer({
+  jsonUrl,
+  value: initialValue,
+  ...props
+}: ComponentProps<typeof JsonViewer> & { jsonUrl: string }) {
+  const [value, setValue] = useState(initialValue);
+  useEffect(() => setValue(initialValue), [initialValue]);
+
+  const loadRef = useRef<(path: Path, ref: JsonRef) => Promise<void>>();
+  loadRef.current = async (path, ref) => {
+    const params = new URLSearchParams({
+      path: JSON.stringify(ref.path),
+      offset: `${ref.offset}`,
+      depth: "2",
+    });
+    const response = await fetch(`${jsonUrl}?${params}`);
+    if (!response.ok) throw new Error(await response.text());
+    const data = await response.json();
+    setValue((root: any) => {
+      // e.g. a long string, or a value sent with depth 0
+      if (!path.length) return data.value;
+      return updateAt(root, path.slice(0, -1), (parent) =>
+        ref.offset
+          ? spliceMore(parent, path[path.length - 1], data.value)
+          : setKey(parent, path[path.length - 1], data.value)
+      );
+    });
+  };
+
+  const valueTypes = useMemo(
+    () => [
+      defineDataType<Record<string, JsonRef>>({
+        is: isRef,
+        Component: ({ value, path }) => {
+          const ref = value[REF_KEY];
+          const [loading, setLoading] = useState(false);
+          return (
+            <span
+              role="button"
+              style={{ cursor: "pointer", opacity: loading ? 0.5 : 1 }}
+              title={`Load ${ref.size} more`}
+              onClick={(e) => {
+                e.stopPropagation();
+                if (loading) return;
+                setLoading(true);
+                loadRef.current!(path, ref).catch((err) => {
+                  console.error(err);
+                  setLoading(false);
+                });
+              }}
+            >
+              {ref.preview} <i className="fa-regular fa-circle-plus"></i>
+            </span>
+          );
+        },
+      }),
+    ],
+    []
+  );
+
+  return <JsonViewer value={value} valueTypes={valueTypes} {...props} />;
+}
+
+function updateAt(node: any, path: Path, fn: (node: any) => any): any {
+  if (!path.length) return fn(node);
+  const [key, ...rest] = path;
+  return setKey(node, key, updateAt(node[key], rest, fn));
+}
+
+function setKey(node: any, key: string | number, child: any): any {
+  if (Array.isArray(node)) {
+    const copy = [...node];
+    copy[key as number] = child;
+    return copy;
+  }
+  return { ...node, [key]: child };
+}
+
+// replace the "... more" placeholder at `key` with the next page of items
+function spliceMore(node: any, key: string | number, page: any): any {
+  if (Array.isArray(node)) {
+    return [...node.slice(0, key as number), ...page];
+  }
+  const copy = { ...node };
+  delete copy[key];
+  return { ...copy, ...page };
+}
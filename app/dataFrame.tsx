@@ -0,0 +1,142 @@
+import { useMemo } from "react";
+import { AgGridReact } from "ag-grid-react";
+import type { IDatasource, IGetRowsParams } from "ag-grid-community";
+import { FullscreenOverlay, theme } from "~/dataTable";
+
+type EncodedColumn = {
+  name: string;
+  dtype?: keyof typeof typedArrays;
+  bdata?: string;
+  values?: Array<any>;
+};
+
+type EncodedFrame = {
+  columns: Array<EncodedColumn>;
+  // whether the first column is the index
+  index: boolean;
+  offset: number;
+  total: number;
+};
+
+// rows only point into the decoded columns, so that cells aren't copied into row objects
+type FrameRow = { columns: Array<ArrayLike<any>>; idx: number };
+
+const typedArrays = {
+  f8: Float64Array,
+  f4: Float32Array,
+  i4: Int32Array,
+  u4: Uint32Array,
+  i2: Int16Array,
+  u2: Uint16Array,
+  i1: Int8Array,
+  u1: Uint8Array,
+};
+
+export function decodeTypedArray({
+  dtype,
+  bdata,
+}: {
+  dtype: keyof typeof typedArrays;
+  bdata: string;
+}): ArrayLike<number> {
+  const binary = atob(bdata);
+  const bytes = new Uint8Array(binary.length);
+  for (let i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+  return new typedArrays[dtype](bytes.buffer);
+}
+
+function decodeRows(frame: EncodedFrame): Array<FrameRow> {
+  const columns = frame.columns.map((col) =>
+    col.dtype && col.bdata
+      ? decodeTypedArray({ dtype: col.dtype, bdata: col.bdata })
+      : col.values ?? []
+  );
+  const numRows = columns.length ? columns[0].length : 0;
+  return Array.from({ length: numRows }, (_, idx) => ({ columns, idx }));
+}
+
+export function DataFrame({
+  data,
+  dataUrl,
+  pageSize = 100,
+  height,
+}: {
+  data: EncodedFrame;
+  dataUrl?: string;
+  // rows per window, same as the first window that's sent along with the page
+  pageSize?: number;
+  height?: number;
+}) {
+  const rows = useMemo(() => decodeRows(data), [data]);
+
+  const columnDefs = useMemo(
+    () =>
+      data.columns.map((col, j) => ({
+        field: `${j}`,
+        headerName: col.name,
+        pinned: j === 0 && data.index ? ("left" as const) : undefined,
+        sortable: !dataUrl,
+        valueGetter: (params: any) => {
+          const row: FrameRow | undefined = params.data;
+          if (!row) return null;
+          const value = row.columns[j][row.idx];
+          return Number.isNaN(value) ? null : value;
+        },
+      })),
+    [data, dataUrl]
+  );
+
+  const datasource: IDatasource | undefined = useMemo(() => {
+    if (!dataUrl) return;
+    return {
+      getRows: async (params: IGetRowsParams) => {
+        // the first window is sent along with the page
+        if (
+          params.startRow >= data.offset &&
+          params.endRow <= data.offset + rows.length
+        ) {
+          params.successCallback(
+            rows.slice(
+              params.startRow - data.offset,
+              params.endRow - data.offset
+            ),
+            data.total
+          );
+          return;
+        }
+        try {
+          const query = new URLSearchParams({
+            offset: `${params.startRow}`,
+            limit: `${params.endRow - params.startRow}`,
+            index: `${data.index}`,
+          });
+          const response = await fetch(`${dataUrl}?${query}`);
+          if (!response.ok) throw new Error(await response.text());
+          const frame: EncodedFrame = await response.json();
+          params.successCallback(decodeRows(frame), frame.total);
+        } catch (err) {
+          console.error(err);
+          params.failCallback();
+        }
+      },
+    };
+  }, [data, dataUrl, rows]);
+
+  return (
+    <FullscreenOverlay height={height}>
+      <AgGridReact
+        theme={theme}
+        columnDefs={columnDefs}
+        {...(datasource
+          ? {
+              rowModelType: "infinite",
+              datasource,
+              cacheBlockSize: pageSize,
+            }
+          : { rowData: rows })}
+      />
+    </FullscreenOverlay>
+  );
+}
@@ -1,15 +1,16 @@
-import { useEffect, useState, useMemo } from "react";
+import { useCallback, useEffect, useState, useMemo } from "react";
 import { AgGridReact } from "ag-grid-react";
 import {
   ModuleRegistry,
   AllCommunityModule,
   themeQuartz,
 } from "ag-grid-community";
+import type { IDatasource, IGetRowsParams } from "ag-grid-community";
 import * as XLSX from "xlsx";
 import * as cptable from "codepage";
 import ReactDOM from "react-dom";
 
-const theme = themeQuartz.withParams({
+export const theme = themeQuartz.withParams({
   borderRadius: 6,
   browserColorScheme: "light",
   fontFamily: "inherit",
@@ -27,35 +28,132 @@ XLSX.set_cptable(cptable);
 // Register all community modules for AG Grid v34+
 ModuleRegistry.registerModules([AllCommunityModule]);
 
-export function DataTable({
-  fileUrl,
-  cells,
-  headerSelect,
-  onChange,
-  state,
-}: {
+type DataTableProps = {
   fileUrl?: string;
   cells?: Array<any>;
+  tableUrl?: string;
   headerSelect?: Record<string, any>;
   onChange?: (value: any) => void;
   state?: Record<string, any>;
-}) {
+};
+
+export function DataTable(props: DataTableProps) {
+  if (props.tableUrl) {
+    return <ServerDataTable {...props} tableUrl={props.tableUrl} />;
+  }
+  return <ClientDataTable {...props} />;
+}
+
+// rows are loaded in windows from the server, which also does the sorting & filtering
+function ServerDataTable({
+  tableUrl,
+  headerSelect,
+  onChange,
+  state,
+}: DataTableProps & { tableUrl: string }) {
+  const [colHeaders, setColHeaders] = useState<Array<string> | null>(null);
+
+  const fetchWindow = useCallback(
+    async (params: Record<string, string>) => {
+      const response = await fetch(
+        `${tableUrl}?${new URLSearchParams(params)}`
+      );
+      if (!response.ok) throw new Error(await response.text());
+      return await response.json();
+    },
+    [tableUrl]
+  );
+
+  useEffect(() => {
+    setColHeaders(null);
+    fetchWindow({ offset: "0", limit: "0" }).then(
+      (data) => setColHeaders(data.columns),
+      (err) => console.error(err)
+    );
+  }, [fetchWindow]);
+
+  const datasource: IDatasource = useMemo(
+    () => ({
+      getRows: async (params: IGetRowsParams) => {
+        try {
+          const data = await fetchWindow({
+            offset: `${params.startRow}`,
+            limit: `${params.endRow - params.startRow}`,
+            sort: JSON.stringify(params.sortModel),
+            filter: JSON.stringify(params.filterModel),
+          });
+          params.successCallback(
+            data.rows.map((row: any[]) =>
+              Object.fromEntries(
+                data.columns.map((col: string, idx: number) => [
+                  col,
+                  normalizeCell(row[idx]),
+                ])
+              )
+            ),
+            data.total
+          );
+        } catch (err) {
+          console.error(err);
+          params.failCallback();
+        }
+      },
+    }),
+    [fetchWindow]
+  );
+
+  const columnDefs = useMemo(
+    () =>
+      makeColumnDefs(colHeaders ?? [], {
+        sortable: true,
+        filter: "agTextColumnFilter",
+      }),
+    [colHeaders]
+  );
+
+  if (!colHeaders) return <div>Loading...</div>;
+
+  return (
+    <FullscreenOverlay>
+      <AgGridReact
+        theme={theme}
+        rowModelType="infinite"
+        datasource={datasource}
+        cacheBlockSize={100}
+        autoSizeStrategy={{
+          type: "fitCellContents",
+          defaultMinWidth: 100,
+          columnLimits: [{ colId: "__rowNum__", minWidth: 0 }],
+          defaultMaxWidth: 300,
+        }}
+        readOnlyEdit={true}
+        columnDefs={columnDefs}
+        defaultColDef={
+          headerSelect
+            ? {
+                headerComponent: HeaderWithSelect,
+                headerComponentParams: { headerSelect, onChange, state },
+              }
+            : {}
+        }
+      />
+    </FullscreenOverlay>
+  );
+}
+
+function ClientDataTable({
+  fileUrl,
+  cells,
+  headerSelect,
+  onChange,
+  state,
+}: DataTableProps) {
   const [rowData, setRowData] = useState<Array<any>>([]);
   const [colHeaders, setColHeaders] = useState<Array<string>>([]);
   const [loading, setLoading] = useState<boolean>(!!fileUrl);
   useEffect(() => {
     if (cells && cells.length > 1) {
-      let rows = cells.map((row: any) =>
-        row.map((cell: any) => {
-          if (!cell) {
-            cell = { value: "" };
-          } else if (typeof cell !== "object") {
-            cell = { value: cell };
-          }
-          cell.value = decodeHTMLEntities(cell.value);
-          return cell;
-        })
-      );
+      let rows = cells.map((row: any) => row.map(normalizeCell));
       setColHeaders(rows[0].map((col: any) => col.value));
       setRowData(
         rows
@@ -111,51 +209,7 @@ export function DataTable({
     }
   }, [cells, fileUrl]);
 
-  const columnDefs = useMemo(() => {
-    let cols = [
-      {
-        headerName: "",
-        field: "__rowNum__",
-        valueGetter: (params: any) =>
-          params.node ? params.node.rowIndex + 1 : "",
-        pinned: "left" as const,
-        width: 35,
-        suppressMovable: true,
-        suppressColumnsToolPanel: true,
-        suppressFiltersToolPanel: true,
-        suppressAutoSize: true,
-        sortable: false,
-        filter: false,
-        cellStyle: {
-          backgroundColor: "#f7f7f7",
-          color: "#989898",
-        },
-      },
-      ...colHeaders.map((header) => ({
-        field: header,
-        headerName: header,
-        editable: true,
-        cellEditor: "agLargeTextCellEditor",
-        cellEditorPopup: true,
-        valueGetter: (params: any) => {
-          // Always expect an object with a value property
-          const cell = params.data?.[header];
-          if (cell && typeof cell === "object" && "value" in cell) {
-            return cell.value;
-          }
-          return "";
-        },
-        cellStyle: (params: any) => {
-          const cell = params.data?.[header];
-          if (cell && typeof cell === "object" && cell.style) {
-            return cell.style;
-          }
-          return undefined;
-        },
-      })),
-    ];
-    return cols;
-  }, [colHeaders]);
+  const columnDefs = useMemo(() => makeColumnDefs(colHeaders), [colHeaders]);
 
   if (loading) return <div>Loading...</div>;
 
@@ -185,6 +239,66 @@ export function DataTable({
   );
 }
 
+function makeColumnDefs(
+  colHeaders: Array<string>,
+  extra: Record<string, any> = {}
+) {
+  let cols = [
+    {
+      headerName: "",
+      field: "__rowNum__",
+      valueGetter: (params: any) =>
+        params.node ? params.node.rowIndex + 1 : "",
+      pinned: "left" as const,
+      width: 35,
+      suppressMovable: true,
+      suppressColumnsToolPanel: true,
+      suppressFiltersToolPanel: true,
+      suppressAutoSize: true,
+      sortable: false,
+      filter: false,
+      cellStyle: {
+        backgroundColor: "#f7f7f7",
+        color: "#989898",
+      },
+    },
+    ...colHeaders.map((header) => ({
+      field: header,
+      headerName: header,
+      editable: true,
+      cellEditor: "agLargeTextCellEditor",
+      cellEditorPopup: true,
+      ...extra,
+      valueGetter: (params: any) => {
+        // Always expect an object with a value property
+        const cell = params.data?.[header];
+        if (cell && typeof cell === "object" && "value" in cell) {
+          return cell.value;
+        }
+        return "";
+      },
+      cellStyle: (params: any) => {
+        const cell = params.data?.[header];
+        if (cell && typeof cell === "object" && cell.style) {
+          return cell.style;
+        }
+        return undefined;
+      },
+    })),
+  ];
+  return cols;
+}
+
+function normalizeCell(cell: any) {
+  if (!cell) {
+    cell = { value: "" };
+  } else if (typeof cell !== "object") {
+    cell = { value: cell };
+  }
+  cell.value = decodeHTMLEntities(cell.value);
+  return cell;
+}
+
 function decodeHTMLEntities(text: string) {
   if (typeof text !== "string") return text;
   const txt = document.createElement("textarea");
@@ -247,7 +361,13 @@ function HeaderWithSelect({
   );
 }
 
-function FullscreenOverlay({ children }: { children: React.ReactNode }) {
+export function FullscreenOverlay({
+  children,
+  height = 300,
+}: {
+  children: React.ReactNode;
+  height?: number;
+}) {
   const [fullscreen, setFullscreen] = useState(false);
 
   // Prevent background scroll when fullscreen is open
@@ -328,7 +448,7 @@ function FullscreenOverlay({ children }: { children: React.ReactNode }) {
     return (
       <div style={{ position: "relative" }}>
         {/* Table */}
-        <div style={{ height: 300 }}>{children}</div>
+        <div style={{ height }}>{children}</div>
         {/* Expand button */}
         <button
           aria-label="Expand table"
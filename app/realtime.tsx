@@ -10,9 +10,11 @@ export async function loader({ params, request }: LoaderArgs) {
   }
   return eventStream(request.signal, (send) => {
     let closed = false;
-    function onMsg() {
+    // the data is the new versions of channels, see `isRenderedEvent()` in app.tsx.
+    // null if they're unknown, so that the client always rerenders
+    function onMsg(versions: Record<string, number> | null) {
       if (closed) return;
-      send({ data: Date.now().toString() });
+      send({ data: JSON.stringify({ versions, t: Date.now() }) });
     }
     const subscriber = createSubscriber(channels, onMsg);
     if (!subscriber) return () => {};
@@ -25,7 +27,15 @@ export async function loader({ params, request }: LoaderArgs) {
   });
 }
 
-function createSubscriber(channels: string[], onMsg: () => void) {
+// must match version_key() in realtime_backend.py
+function versionKey(channel: string) {
+  return "gooey-gui/version/" + channel.replace(/^gooey-gui\/state\//, "");
+}
+
+function createSubscriber(
+  channels: string[],
+  onMsg: (versions: Record<string, number> | null) => void
+) {
   if (!redis) {
     console.error(
       "Redis not connected. You must run redis to enable realtime features."
@@ -36,13 +46,25 @@ function createSubscriber(channels: string[], onMsg: () => void) {
   subscriber.on("error", (err) => console.error(err));
   subscriber.on("connect", async () => {
     console.log("Redis Connected:", ...channels);
-    // attempt to fix the slow joiner syndrome
-    if (await redis?.exists(channels)) onMsg();
+    // attempt to fix the slow joiner syndrome.
+    // the client skips this if it has already rendered these versions
+    if (!redis || !(await redis.exists(channels))) return;
+    const versions = await redis.mGet(channels.map(versionKey));
+    // channels that were never set (e.g. an unset `use_state()`) have nothing to render
+    onMsg(
+      Object.fromEntries(
+        channels
+          .map((channel, i) => [channel, versions[i]] as const)
+          .filter(([, version]) => version != null)
+          .map(([channel, version]) => [channel, Number(version)])
+      )
+    );
   });
   subscriber.connect();
   subscriber.subscribe(channels, (msg, channel) => {
     console.log("onMsg", channel, msg);
-    onMsg();
+    // older servers publish a timestamp instead of the version
+    onMsg(msg.includes(".") ? null : { [channel]: Number(msg) });
   });
   return subscriber;
 }
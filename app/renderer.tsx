@@ -20,11 +20,13 @@ import CountdownTimer from "./components/countdown";
 import GooeyPopover from "./components/GooeyPopover";
 import GooeySelect from "./components/GooeySelect";
 import GooeySwitch from "./components/GooeySwitch";
+import LazyJsonViewer from "./components/LazyJsonViewer";
 import { GooeyTooltip } from "./components/GooeyTooltip";
 import GooeySidebar from "./components/Sidebar";
 import { lazyImport } from "./lazyImports";
 
 const { DataTable } = lazyImport(() => import("~/dataTable"));
+const { DataFrame } = lazyImport(() => import("~/dataFrame"));
 
 const { GooeyFileInput } = lazyImport(() => import("~/gooeyFileInput"), {
   fallback: ({ name, label, defaultValue }) => (
@@ -172,6 +174,9 @@ function RenderedTreeNode({
         <DataTable {...props} onChange={onChange} state={state}></DataTable>
       );
     }
+    case "dataframe": {
+      return <DataFrame {...props} />;
+    }
     case "nav-tabs":
       return (
         <ul
@@ -423,6 +428,22 @@ function RenderedTreeNode({
       );
     }
     case "json":
+      if (props.jsonUrl) {
+        return (
+          <LazyJsonViewer
+            style={{
+              overflow: "scroll",
+              marginTop: "1rem",
+              whiteSpace: "pre-wrap",
+            }}
+            rootName={false}
+            value={props.value}
+            defaultInspectDepth={props.defaultInspectDepth}
+            {...props}
+            jsonUrl={props.jsonUrl}
+          />
+        );
+      }
       return (
         <JsonViewer
           style={{
@@ -0,0 +1,54 @@
+import type { TreeNode } from "~/renderer";
+
+export type TreePatch =
+  | { op: "insert"; path: number[]; node: TreeNode }
+  | { op: "remove"; path: number[] }
+  | { op: "replace"; path: number[]; node: TreeNode }
+  | {
+      op: "props";
+      path: number[];
+      set: Record<string, any>;
+      unset: string[];
+    };
+
+// Apply the patches produced by `gooey_gui.core.tree_diff.diff_trees()`.
+// Nodes along each patched path are copied, so the old tree is never mutated.
+export function applyTreePatches(
+  children: Array<TreeNode>,
+  patches: Array<TreePatch>
+): Array<TreeNode> {
+  let root = [...children];
+  for (const patch of patches) {
+    const index = patch.path[patch.path.length - 1];
+    const siblings = copyPath(root, patch.path.slice(0, -1));
+    switch (patch.op) {
+      case "insert":
+        siblings.splice(index, 0, patch.node);
+        break;
+      case "remove":
+        siblings.splice(index, 1);
+        break;
+      case "replace":
+        siblings[index] = patch.node;
+        break;
+      case "props":
+        const props = { ...siblings[index].props, ...patch.set };
+        for (const key of patch.unset) {
+          delete props[key];
+        }
+        siblings[index] = { ...siblings[index], props };
+        break;
+    }
+  }
+  return root;
+}
+
+function copyPath(root: Array<TreeNode>, path: number[]): Array<TreeNode> {
+  let siblings = root;
+  for (const i of path) {
+    const node = { ...siblings[i], children: [...siblings[i].children] };
+    siblings[i] = node;
+    siblings = node.children;
+  }
+  return siblings;
+}
@@ -44,14 +44,23 @@ def root():
 def generate_poem_thread(prompt, channel):
     openai.api_key = os.getenv("OPENAI_API_KEY")
 
-    completion = openai.chat.completions.create(
+    stream = openai.chat.completions.create(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are a brilliant poem writer."},
             {"role": "user", "content": prompt},
         ],
+        stream=True,
     )
-    result = completion.choices[0].message.content or ""
-
-    # push the result to the channel + reload the UI
-    gui.realtime_push(channel, result)
+    # tokens arrive faster than the UI can rerender,
+    # so the publisher batches them up and appends them to the channel at most every 0.2s
+    with gui.RealtimePublisher(window=0.2) as publisher:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if not token:
+                continue
+            # append the token to the channel + reload the UI.
+            # readers only fetch the tokens they haven't seen yet
+            publisher.append(channel, token)
@@ -17,5 +17,6 @@ from .input_widgets import (
     slider,
     checkbox,
 )
+from .memo import memo, memo_cache_info, memo_cache_clear
 from .pills import pill
 from .url_button import url_button
@@ -1,4 +1,3 @@
-import base64
 import html as html_lib
 import math
 import textwrap
@@ -21,6 +20,12 @@ def _default_format(value: typing.Any) -> str:
     return str(value)
 
 
+def _as_sequence(options: typing.Iterable[T]) -> typing.Sequence[T]:
+    if isinstance(options, (list, tuple)):
+        return options
+    return list(options)
+
+
 def dummy(*args, **kwargs):
     return core.NestingCtx()
 
@@ -28,7 +33,6 @@ def dummy(*args, **kwargs):
 spinner = dummy
 set_page_config = dummy
 form = dummy
-dataframe = dummy
 
 
 def countdown_timer(
@@ -121,10 +125,7 @@ def _node(nodename: str, **props):
 
 
 def styled(css: str) -> core.NestingCtx:
-    css = dedent(css).strip()
-    className = "gui-" + core.md5_values(css)
-    selector = "." + className
-    css = css.replace("&", selector)
+    className, css = core.compile_styles(css)
     core.add_styles(className, css)
     return _node("", className=className)
 
@@ -252,8 +253,14 @@ def image(
     alt: str = None,
     href: str = None,
     show_download_button: bool = False,
+    sizes: str | None = None,
     **props,
 ):
+    """
+    If `sizes` is given for an image url, e.g. `"(max-width: 768px) 50vw, 300px"`,
+    smaller thumbnails are generated in the background, and offered to the browser via `srcset`
+    once they are ready. Requires the built-in endpoints to be mounted (see `gui.mount()`).
+    """
     try:
         import numpy as np
 
@@ -264,10 +271,13 @@ def image(
         if not src.shape:
             return
         # ensure image is not too large
-        data = _export_cv2_img(src, 128)
-        # convert to base64
-        b64 = base64.b64encode(data).decode("utf-8")
-        src = "data:image/png;base64," + b64
+        src = core.image_src(src, height=128)
+    elif src and (isinstance(src, bytes) or type(src).__module__.startswith("PIL.")):
+        src = core.image_src(src)
+    elif sizes and src and not src.startswith("data:"):
+        srcset = core.image_srcset(src)
+        if srcset:
+            props.update(srcSet=srcset, sizes=sizes)
     if not src:
         return
     core.RenderTreeNode(
@@ -286,20 +296,6 @@ def image(
         )
 
 
-def _export_cv2_img(img, size: int) -> bytes:
-    """
-    Resize the image to the given size, keeping the aspect ratio.
-    """
-    import cv2
-
-    h, w = img.shape[:2]
-    new_h = size
-    new_w = int(w * new_h / h)
-    img = cv2.resize(img, (new_w, new_h))
-    data = cv2.imencode(".png", img)[1].tostring()
-    return data
-
-
 def video(
     src: str,
     caption: str = None,
@@ -364,7 +360,7 @@ def text_area(
     #     assert not value, "only one of value or key can be provided"
     # else:
     if not key:
-        key = core.md5_values(
+        key = core.widget_key(
             "textarea",
             label,
             height,
@@ -450,12 +446,18 @@ def multiselect(
     allow_none: bool = False,
     *,
     disabled: bool = False,
+    server_search: bool = False,
 ) -> list[T]:
+    """
+    With `server_search=True`, only the selected options are sent to the client,
+    which searches the rest through the built-in options endpoint (see `gui.mount()`).
+    Use this for very long option lists.
+    """
     if not options:
         return []
-    options = list(options)
+    options = _as_sequence(options)
     if not key:
-        key = core.md5_values("multiselect", label, options, help)
+        key = core.widget_key("multiselect", label, help, options=options)
     value = core.session_state.get(key) or []
     if not isinstance(value, list):
         value = [value]
@@ -463,6 +465,9 @@ def multiselect(
     if not allow_none and not value:
         value = [options[0]]
     core.session_state[key] = value
+    option_props = server_search and core.searchable_options(
+        options, format_func, value
+    )
     core.RenderTreeNode(
         name="select",
         props=dict(
@@ -474,10 +479,7 @@ def multiselect(
             isMulti=True,
             defaultValue=value,
             allow_none=allow_none,
-            options=[
-                {"value": option, "label": str(format_func(option))}
-                for option in options
-            ],
+            **(option_props or _option_props(options, format_func)),
         ),
     ).mount()
     return value
@@ -495,20 +497,36 @@ def selectbox(
     label_visibility: LabelVisibility = "visible",
     value: T = None,
     allow_none: bool = False,
+    server_search: bool = False,
     **props,
 ) -> T | None:
+    """
+    With `server_search=True`, only the selected option is sent to the client,
+    which searches the rest through the built-in options endpoint (see `gui.mount()`).
+    Use this for very long option lists.
+    """
     if not options:
         return None
     if label_visibility != "visible":
         label = None
-    options = list(options)
-    if allow_none:
-        options.insert(0, None)
+    options = _as_sequence(options)
     if not key:
-        key = core.md5_values("select", label, options, help, label_visibility)
+        key = core.widget_key(
+            "select", label, help, label_visibility, allow_none, options=options
+        )
     value = core.session_state.setdefault(key, value)
-    if value not in options:
-        value = core.session_state[key] = options[0]
+    if not (allow_none and value is None) and value not in options:
+        value = core.session_state[key] = None if allow_none else options[0]
+    option_props = server_search and core.searchable_options(
+        options, format_func, [] if value is None and allow_none else [value]
+    )
+    if option_props:
+        # the index doesn't contain the blank option, so let the user clear the value instead
+        option_props["isClearable"] = allow_none
+    elif allow_none:
+        option_props = _option_props([None, *options], format_func)
+    else:
+        option_props = _option_props(options, format_func)
     core.RenderTreeNode(
         name="select",
         props=dict(
@@ -518,16 +536,23 @@ def selectbox(
             tooltipPlacement=tooltip_placement,
             isDisabled=disabled,
             defaultValue=value,
-            options=[
-                {"value": option, "label": str(format_func(option))}
-                for option in options
-            ],
+            **option_props,
             **props,
         ),
     ).mount()
     return value
 
 
+def _option_props(
+    options: typing.Sequence[T], format_func: typing.Callable[[T], typing.Any]
+) -> dict[str, typing.Any]:
+    return dict(
+        options=[
+            {"value": option, "label": str(format_func(option))} for option in options
+        ]
+    )
+
+
 def download_button(
     label: str,
     url: str,
@@ -572,7 +597,7 @@ def button(
         st.button("Link Button", key="test3", type="link")
     """
     if not key:
-        key = core.md5_values("button", label, help, type, props)
+        key = core.widget_key("button", label, help, type, props)
     className = f"btn btn-theme btn-{type} " + props.pop("className", "")
     core.RenderTreeNode(
         name=component,
@@ -618,7 +643,7 @@ def expander(label: str, *, expanded: bool = False, key: str = None, **props):
         props=dict(
             label=dedent(label),
             open=expanded,
-            name=key or core.md5_values(label, expanded, props),
+            name=key or core.widget_key("expander", label, expanded, props),
             **props,
         ),
     )
@@ -647,7 +672,7 @@ def file_uploader(
         label = None
     key = upload_key or key
     if not key:
-        key = core.md5_values(
+        key = core.widget_key(
             "file_uploader",
             label,
             accept,
@@ -690,7 +715,25 @@ def file_uploader(
     return value
 
 
-def json(value: typing.Any, expanded: bool = False, depth: int = 1, **props):
+def json(
+    value: typing.Any,
+    expanded: bool = False,
+    depth: int = 1,
+    *,
+    key: str | None = None,
+    **props,
+):
+    """
+    If the built-in endpoints are mounted (see `gui.mount()`), large values are sent lazily:
+    only the levels that are shown expanded (plus one), with long lists & strings cut short.
+    The rest is fetched as the user expands it.
+
+    Large values are encoded on every render to identify them,
+    pass a `key` that changes whenever the value does to skip that.
+    """
+    lazy = core.lazy_json(value, depth=(3 if expanded else depth) + 1, key=key)
+    if lazy:
+        props["jsonUrl"], value = lazy
     core.RenderTreeNode(
         name="json",
         props=dict(
@@ -702,14 +745,48 @@ def json(value: typing.Any, expanded: bool = False, depth: int = 1, **props):
     ).mount()
 
 
-def data_table(file_url_or_cells: str | list, **props):
-    if isinstance(file_url_or_cells, str):
+def data_table(file_url_or_cells: str | list, *, key: str | None = None, **props):
+    """
+    If the built-in endpoints are mounted (see `gui.mount()`), csv/xlsx files and large cell lists
+    are parsed on the server, and the client only fetches the rows it's showing.
+
+    Large cell lists are hashed on every render to identify them,
+    pass a `key` that changes whenever the cells do to skip that.
+    """
+    table_url = core.register_table(file_url_or_cells, key=key)
+    if table_url:
+        props["tableUrl"] = table_url
+    elif isinstance(file_url_or_cells, str):
         props["fileUrl"] = file_url_or_cells
     else:
         props["cells"] = file_url_or_cells
     return _node("data-table", **props)
 
 
+def dataframe(
+    df: "pd.DataFrame",
+    *,
+    hide_index: bool = False,
+    height: int = 400,
+    **props,
+) -> core.NestingCtx:
+    """
+    Render a dataframe as a single node, encoded column by column.
+
+    Frames with more than `GUI_DATAFRAME_INLINE_ROWS` rows are sent in windows
+    as the user scrolls, if the built-in endpoints are mounted (see `gui.mount()`).
+    """
+    data_url = core.register_frame(df)
+    if data_url:
+        data = core.encode_frame(
+            df, limit=core.DATAFRAME_PAGE_ROWS, index=not hide_index
+        )
+        props["pageSize"] = core.DATAFRAME_PAGE_ROWS
+    else:
+        data = core.encode_frame(df, index=not hide_index)
+    return _node("dataframe", data=data, dataUrl=data_url, height=height, **props)
+
+
 def table(df: "pd.DataFrame"):
     with tag("table", className="table table-striped table-sm"):
         with tag("thead"):
@@ -741,10 +818,10 @@ def horizontal_radio(
 ) -> T | None:
     if not options:
         return None
-    options = list(options)
+    options = _as_sequence(options)
     if not key:
-        key = core.md5_values(
-            "horizontal_radio", label, options, help, label_visibility
+        key = core.widget_key(
+            "horizontal_radio", label, help, label_visibility, options=options
         )
     value = core.session_state.setdefault(key, value)
     if value not in options and checked_by_default:
@@ -782,9 +859,9 @@ def radio(
 ) -> T | None:
     if not options:
         return None
-    options = list(options)
+    options = _as_sequence(options)
     if not key:
-        key = core.md5_values("radio", label, options, help, label_visibility)
+        key = core.widget_key("radio", label, help, label_visibility, options=options)
     value = core.session_state.setdefault(key, value)
     if value not in options and checked_by_default:
         value = core.session_state[key] = options[0]
@@ -826,11 +903,16 @@ def breadcrumb_item(inner_html: str, link_to: str | None = None, **props):
 
 
 def plotly_chart(figure_or_data, **kwargs):
-    data = (
-        figure_or_data.to_plotly_json()
-        if hasattr(figure_or_data, "to_plotly_json")
-        else figure_or_data
-    )
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        data = (
+            figure_or_data.to_plotly_json()
+            if hasattr(figure_or_data, "to_plotly_json")
+            else figure_or_data
+        )
+    else:
+        data = core.encode_plotly_figure(figure_or_data)
     core.RenderTreeNode(
         name="plotly-chart",
         props=dict(
@@ -883,7 +965,7 @@ def switch(
     **props,
 ) -> bool:
     if not key:
-        key = core.md5_values("input", "switch", label, help, label_visibility)
+        key = core.widget_key("switch", label, help, label_visibility)
     value = core.session_state.setdefault(key, value)
     if label_visibility != "visible":
         label = None
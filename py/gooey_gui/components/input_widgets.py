@@ -211,7 +211,7 @@ def _html_input(
     **kwargs,
 ) -> typing.Any:
     if not key:
-        key = core.md5_values("input", input_type, label, help, label_visibility)
+        key = core.widget_key(input_type, label, help, label_visibility)
     value = core.session_state.setdefault(key, value)
     if label_visibility != "visible":
         label = None
@@ -0,0 +1,143 @@
+import sys
+import typing
+from copy import deepcopy
+from functools import wraps
+
+from decouple import config
+
+from gooey_gui import core
+from gooey_gui.core.cache import CacheInfo, LRUCache
+from gooey_gui.core.encoder import dumps
+from gooey_gui.core.state import localctx
+
+F = typing.TypeVar("F", bound=typing.Callable[..., typing.Any])
+
+
+class _Fragment(typing.NamedTuple):
+    nodes: list[core.RenderTreeNode]
+    styles: dict[str, str]
+    retval: typing.Any = None
+
+
+_fragment_cache: LRUCache[str, _Fragment] = LRUCache(
+    maxsize=config("GUI_MEMO_MAXSIZE", 1024, cast=int),
+    max_bytes=config("GUI_MEMO_MAX_BYTES", 64 * 1024 * 1024, cast=int),
+    ttl=config("GUI_MEMO_TTL", 3600, cast=float),
+    sizeof=lambda fragment: len(dumps(fragment.nodes)),
+)
+
+
+class Memo:
+    def __init__(
+        self,
+        key: str | None = None,
+        *,
+        deps: typing.Iterable = (),
+        ttl: float | None = None,
+    ):
+        self.key = key
+        self.deps = tuple(deps)
+        self.ttl = ttl
+        self.hit = False
+        self.fragment: _Fragment | None = None
+        self._parent: core.RenderTreeNode | None = None
+        self._start = 0
+        self._styles_before: set[str] = set()
+
+    def _cache_key(self) -> str:
+        return core.hash_values(self.key, *self.deps)
+
+    def __enter__(self) -> bool:
+        self._parent = localctx.render_root
+        self.fragment = _fragment_cache.get(self._cache_key())
+        if self.fragment is not None:
+            self._replay(self.fragment)
+            self.hit = True
+            return True
+        self._start = len(self._parent.children)
+        self._styles_before = set(localctx.styles)
+        return False
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.hit or exc_type is not None:
+            return
+        self._save()
+
+    def _replay(self, fragment: _Fragment):
+        # the cached nodes are frozen, so they can be shared between renders
+        self._parent.children.extend(fragment.nodes)
+        for className, css in fragment.styles.items():
+            core.add_styles(className, css)
+
+    def _save(self, retval: typing.Any = None):
+        fragment = _Fragment(
+            nodes=deepcopy(self._parent.children[self._start :]),
+            styles={
+                className: css
+                for className, css in localctx.styles.items()
+                if className not in self._styles_before
+            },
+            retval=retval,
+        )
+        _fragment_cache.set(self._cache_key(), fragment, ttl=self.ttl)
+
+    def __call__(self, fn: F) -> F:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            m = Memo(
+                self.key or f"{fn.__module__}.{fn.__qualname__}",
+                deps=(*self.deps, args, kwargs),
+                ttl=self.ttl,
+            )
+            if m.__enter__():
+                return m.fragment.retval
+            retval = fn(*args, **kwargs)
+            m._save(retval)
+            return retval
+
+        return wrapper
+
+
+def memo(
+    key: str | typing.Callable | None = None,
+    *,
+    deps: typing.Iterable = (),
+    ttl: float | None = None,
+) -> Memo:
+    """
+    Cache the render tree produced by a block of code, and replay it on later renders
+    (across requests and sessions) as long as `key` and `deps` stay the same.
+
+    Only use this for content that doesn't depend on anything other than `deps`,
+    since widget side effects (e.g. on `session_state`) are not replayed.
+
+    As a context manager, the block still runs, so it should check whether the
+    fragment was replayed:
+
+        with gui.memo("pricing-table", deps=[plans_version]) as cached:
+            if not cached:
+                render_pricing_table()
+
+    As a decorator, the function is skipped entirely on a cache hit,
+    and its arguments are used as deps:
+
+        @gui.memo(ttl=600)
+        def docs_sidebar(page_slug: str):
+            ...
+    """
+    if callable(key):
+        # used as a bare decorator
+        return Memo(deps=deps, ttl=ttl)(key)
+    if key is None:
+        # default to the call site, so that separate blocks don't collide
+        frame = sys._getframe(1)
+        key = f"{frame.f_code.co_filename}:{frame.f_lineno}"
+    return Memo(key, deps=deps, ttl=ttl)
+
+
+def memo_cache_info() -> CacheInfo:
+    return _fragment_cache.info()
+
+
+def memo_cache_clear():
+    _fragment_cache.clear()
@@ -1,29 +1,81 @@
 import typing
 
+from .arrays import encode_typed_array, encode_plotly_data, encode_plotly_figure
+from .blob_store import (
+    BlobStore,
+    MemoryBlobStore,
+    LocalDiskBlobStore,
+    RedisBlobStore,
+    get_blob_store,
+    set_blob_store,
+)
+from .codec import ChannelCodec, get_channel_codec, set_channel_codec
+from .dataframes import DATAFRAME_PAGE_ROWS, encode_frame, register_frame
+from .dispatcher import (
+    LocalDispatcher,
+    RealtimeDispatcher,
+    Subscription,
+    get_dispatcher,
+)
+from .encoder import register_encoder
+from .endpoints import mount, url_for
 from .exceptions import (
     RedirectException,
     QueryParamsRedirectException,
     StopException,
     RerunException,
+    RerunLimitExceeded,
     rerun,
     stop,
 )
+from .images import image_src, get_image_store, set_image_store
+from .keys import hash_values, widget_key, callsite
+from .lazy_json import lazy_json
+from .metrics import (
+    RenderStats,
+    add_render_hook,
+    remove_render_hook,
+    prometheus_metrics,
+    mount_metrics,
+)
+from .options_index import searchable_options
 from .pubsub import (
     realtime_push,
     realtime_pull,
+    realtime_append,
+    RealtimePublisher,
     realtime_subscribe,
+    realtime_push_async,
+    realtime_pull_async,
+    realtime_subscribe_async,
     get_subscriptions,
     realtime_clear_subs,
     md5_values,
 )
+from .realtime_backend import (
+    RealtimeBackend,
+    MemoryRealtimeBackend,
+    RedisRealtimeBackend,
+    get_realtime_backend,
+    set_realtime_backend,
+)
+from .realtime_sse import realtime_sse_response
 from .renderer import (
     RenderTreeNode,
     NestingCtx,
     renderer,
+    async_renderer,
     route,
     current_root_ctx,
     add_styles,
 )
+from .session_store import (
+    SessionStore,
+    MemorySessionStore,
+    RedisSessionStore,
+    get_session_store,
+    set_session_store,
+)
 from .state import (
     get_session_state,
     set_session_state,
@@ -31,6 +83,14 @@ from .state import (
     set_query_params,
 )
 from .state_interactions import use_state, run_in_thread, cache_in_session_state
+from .styles import compile_styles
+from .tables import register_table, set_table_fetcher
+from .thumbnails import (
+    image_srcset,
+    set_image_fetcher,
+    set_thumbnail_store,
+    url_fetcher,
+)
 
 session_state: dict[str, typing.Any]
 
@@ -0,0 +1,183 @@
+import base64
+import hashlib
+import typing
+
+from decouple import config
+
+from .cache import LRUCache
+from .encoder import dumps
+from .keys import _hasher
+
+# numeric lists shorter than this are left as json lists
+TYPED_ARRAY_MIN_LEN = config("GUI_TYPED_ARRAY_MIN_LEN", 256, cast=int)
+
+# the dtypes that js typed arrays (and plotly.js) can decode, in numpy's `kind + itemsize` notation
+TYPED_ARRAY_DTYPES = {"f8", "f4", "i4", "u4", "i2", "u2", "i1", "u1"}
+
+
+def encode_typed_array(arr: typing.Any) -> dict[str, str] | None:
+    """
+    Encode a numpy array as `{"dtype": ..., "bdata": <base64 little-endian bytes>}`,
+    the typed array format understood by plotly.js and the `dataframe` component.
+    Multi-dimensional arrays also get a `shape` like `"3, 4"`.
+
+    Returns `None` for arrays that can't be represented as a typed array, e.g. strings or objects.
+    """
+    import numpy as np
+
+    arr = np.asarray(arr)
+    match arr.dtype.kind:
+        case "b":
+            arr = arr.astype("u1")
+        case "i" | "u" if arr.dtype.itemsize == 8:
+            arr = _downcast_int64(arr)
+        case "f" if arr.dtype.itemsize == 2:
+            arr = arr.astype("f4")
+    dtype = f"{arr.dtype.kind}{arr.dtype.itemsize}"
+    if dtype not in TYPED_ARRAY_DTYPES:
+        return None
+    arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+    ret = {"dtype": dtype, "bdata": base64.b64encode(arr.tobytes()).decode()}
+    if arr.ndim > 1:
+        ret["shape"] = ", ".join(map(str, arr.shape))
+    return ret
+
+
+def _downcast_int64(arr):
+    # js has no 64-bit int typed arrays (besides BigInt ones, which plotly can't read)
+    import numpy as np
+
+    if not arr.size:
+        return arr.astype("i4")
+    lo, hi = arr.min(), arr.max()
+    for dtype in ("i4", "u4"):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return arr.astype(dtype)
+    # lossy past 2**53, same as plain json numbers in js
+    return arr.astype("f8")
+
+
+# hash of an array's contents -> its encoding
+_encoded_arrays: LRUCache[str, dict[str, str]] = LRUCache(
+    maxsize=config("GUI_TYPED_ARRAY_CACHE_MAXSIZE", 4096, cast=int),
+    max_bytes=config("GUI_TYPED_ARRAY_CACHE_MAX_BYTES", 256 * 1024 * 1024, cast=int),
+    sizeof=lambda encoded: len(encoded["bdata"]),
+)
+
+
+def encode_plotly_data(data: typing.Any) -> typing.Any:
+    """
+    Replace the numeric arrays (and long numeric lists) in plotly traces with typed arrays.
+    Encodings are cached by content, so unchanged charts aren't re-encoded on every render.
+    """
+    import numpy as np
+
+    if isinstance(data, dict):
+        return {key: encode_plotly_data(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        if len(data) >= TYPED_ARRAY_MIN_LEN and not isinstance(data[0], (str, dict)):
+            try:
+                arr = np.asarray(data)
+            except ValueError:
+                # ragged nested lists
+                arr = None
+            if arr is not None and arr.dtype.kind in "iuf":
+                return _encode_cached(arr)
+        return [encode_plotly_data(value) for value in data]
+    if isinstance(data, np.ndarray) and data.dtype.kind in "iuf":
+        return _encode_cached(data)
+    return data
+
+
+def _encode_cached(arr) -> typing.Any:
+    import numpy as np
+
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((arr.dtype.str, arr.shape)).encode())
+    h.update(arr.data)
+    digest = h.hexdigest()
+    encoded = _encoded_arrays.get(digest)
+    if encoded is None:
+        encoded = encode_typed_array(arr)
+        if encoded is None:
+            return arr
+        _encoded_arrays.set(digest, encoded)
+    return encoded
+
+
+# fingerprint of a figure's contents -> (its json with typed arrays, encoded size)
+_encoded_figures: LRUCache[str, tuple[typing.Any, int]] = LRUCache(
+    maxsize=config("GUI_PLOTLY_CACHE_MAXSIZE", 256, cast=int),
+    max_bytes=config("GUI_PLOTLY_CACHE_MAX_BYTES", 256 * 1024 * 1024, cast=int),
+    sizeof=lambda entry: entry[1],
+)
+
+
+def encode_plotly_figure(figure_or_data: typing.Any) -> typing.Any:
+    """
+    Returns the json of a plotly figure (or of its dict) with typed arrays, see `encode_plotly_data()`.
+
+    Cached by a fingerprint of the figure's contents, which is much cheaper to compute
+    than `to_plotly_json()`, since that deep-copies the whole figure.
+    """
+    import numpy as np
+
+    h = _hasher()
+    _fingerprint(h, _figure_contents(figure_or_data), np)
+    digest = h.hexdigest()
+    entry = _encoded_figures.get(digest)
+    if entry is not None:
+        return entry[0]
+    data = (
+        figure_or_data.to_plotly_json()
+        if hasattr(figure_or_data, "to_plotly_json")
+        else figure_or_data
+    )
+    if isinstance(data, dict) and "data" in data:
+        # only traces can hold typed arrays
+        data = dict(data, data=encode_plotly_data(data["data"]))
+    _encoded_figures.set(digest, (data, len(dumps(data))))
+    return data
+
+
+def _figure_contents(figure_or_data: typing.Any) -> typing.Any:
+    # a plotly figure's own data & layout, instead of the copy made by `to_plotly_json()`
+    data = getattr(figure_or_data, "_data", None)
+    layout = getattr(figure_or_data, "_layout", None)
+    if isinstance(data, list) and isinstance(layout, dict):
+        frames = getattr(figure_or_data, "frames", None) or ()
+        return data, layout, [frame.to_plotly_json() for frame in frames]
+    if hasattr(figure_or_data, "to_plotly_json"):
+        return figure_or_data.to_plotly_json()
+    return figure_or_data
+
+
+def _fingerprint(h, value: typing.Any, np):
+    if isinstance(value, dict):
+        h.update(b"{")
+        for key, item in value.items():
+            h.update(repr(key).encode())
+            _fingerprint(h, item, np)
+        h.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        if len(value) >= TYPED_ARRAY_MIN_LEN and not isinstance(
+            value[0], (dict, list, tuple, np.ndarray)
+        ):
+            # long lists of numbers or strings
+            h.update(repr(value).encode())
+        else:
+            h.update(b"[")
+            for item in value:
+                _fingerprint(h, item, np)
+            h.update(b"]")
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        if value.dtype.hasobject:
+            h.update(repr(value.tolist()).encode())
+        else:
+            h.update(np.ascontiguousarray(value).data)
+    else:
+        h.update(repr(value).encode())
+    h.update(b"\x1f")
@@ -0,0 +1,446 @@
+import asyncio
+import contextlib
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import typing
+from pathlib import Path
+
+from decouple import config
+from loguru import logger
+
+from .cache import LRUCache
+from .encoder import dumps, loads
+from .metrics import count_redis_calls
+
+# session state values larger than this (in bytes) go to the blob store. 0 = disabled
+BLOB_THRESHOLD = config("GUI_BLOB_THRESHOLD", 0, cast=int)
+BLOB_TTL = config("GUI_BLOB_TTL", 24 * 60 * 60, cast=int)
+BLOB_REF_KEY = "__gui_blob__"
+
+_DIGEST_RE = re.compile(r"[0-9a-f]{32,64}")
+
+
+def is_valid_digest(digest: str) -> bool:
+    """Whether `digest` is a hex digest, i.e. safe to use as a key or file name."""
+    return bool(_DIGEST_RE.fullmatch(digest))
+
+
+class BlobStore:
+    """A content-addressed store, where blobs are keyed by the sha256 of their data."""
+
+    # whether other server processes can read what this one puts in the store
+    shared = True
+
+    def get(self, digest: str) -> bytes | None:
+        raise NotImplementedError
+
+    def put(self, digest: str, data: bytes):
+        raise NotImplementedError
+
+    def exists(self, digest: str) -> bool:
+        return self.get(digest) is not None
+
+    async def aget(self, digest: str) -> bytes | None:
+        return await asyncio.to_thread(self.get, digest)
+
+    async def aput(self, digest: str, data: bytes):
+        await asyncio.to_thread(self.put, digest, data)
+
+
+class MemoryBlobStore(BlobStore):
+    """
+    Keeps blobs in this process' memory, evicting the least recently used ones.
+
+    Only suitable for a single worker, and for values that can be recomputed,
+    since an evicted blob is gone for good.
+    """
+
+    shared = False
+
+    def __init__(
+        self,
+        maxsize: int = config("GUI_BLOB_STORE_MAXSIZE", 100_000, cast=int),
+        max_bytes: int = config(
+            "GUI_BLOB_STORE_MAX_BYTES", 256 * 1024 * 1024, cast=int
+        ),
+        ttl: float | None = BLOB_TTL,
+    ):
+        self._cache: LRUCache[str, bytes] = LRUCache(
+            maxsize=maxsize, max_bytes=max_bytes, ttl=ttl, sizeof=len
+        )
+
+    def get(self, digest: str) -> bytes | None:
+        return self._cache.get(digest)
+
+    def put(self, digest: str, data: bytes):
+        self._cache.set(digest, data)
+
+    def exists(self, digest: str) -> bool:
+        return digest in self._cache
+
+    async def aget(self, digest: str) -> bytes | None:
+        return self.get(digest)
+
+    async def aput(self, digest: str, data: bytes):
+        self.put(digest, data)
+
+
+class LocalDiskBlobStore(BlobStore):
+    """
+    Stores blobs as files under `directory`.
+
+    If `max_bytes` is set, the least recently read or written files are deleted
+    once the directory grows past it.
+    """
+
+    def __init__(self, directory: str | os.PathLike, max_bytes: int | None = None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        # lazily initialized from the files already on disk
+        self._nbytes: int | None = None
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> Path:
+        return self.directory / digest[:2] / digest
+
+    def get(self, digest: str) -> bytes | None:
+        path = self._path(digest)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        if self.max_bytes is not None:
+            # mtime doubles as the last access time for eviction
+            path.touch()
+        return data
+
+    def exists(self, digest: str) -> bool:
+        return self._path(digest).exists()
+
+    def put(self, digest: str, data: bytes):
+        path = self._path(digest)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file first, so that readers never see partial blobs.
+        # Unique per write, since identical blobs are often put concurrently
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+        if self.max_bytes is not None:
+            with self._lock:
+                if self._nbytes is None:
+                    self._nbytes = sum(size for _, size, _ in self._scan())
+                else:
+                    self._nbytes += len(data)
+                if self._nbytes > self.max_bytes:
+                    self._evict()
+
+    def _scan(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for path in self.directory.glob("*/*"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        # rescan, since other processes may share the directory
+        entries = sorted(self._scan())
+        nbytes = sum(size for _, size, _ in entries)
+        # leave some headroom, so that we don't rescan on every put
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if nbytes <= target:
+                break
+            path.unlink(missing_ok=True)
+            nbytes -= size
+        self._nbytes = nbytes
+
+
+class RedisBlobStore(BlobStore):
+    def __init__(self, ex: int | None = BLOB_TTL):
+        self.ex = ex
+
+    def get(self, digest: str) -> bytes | None:
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        return get_redis().get(f"gooey-gui/blob/{digest}")
+
+    def put(self, digest: str, data: bytes):
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        get_redis().set(f"gooey-gui/blob/{digest}", data, ex=self.ex)
+
+    def exists(self, digest: str) -> bool:
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        return bool(get_redis().exists(f"gooey-gui/blob/{digest}"))
+
+    async def aget(self, digest: str) -> bytes | None:
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        return await get_async_redis().get(f"gooey-gui/blob/{digest}")
+
+    async def aput(self, digest: str, data: bytes):
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        await get_async_redis().set(f"gooey-gui/blob/{digest}", data, ex=self.ex)
+
+
+_blob_store: BlobStore | None = None
+
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+    if _blob_store is None:
+        # session state may hold the only reference to a blob, and none of the stores
+        # suit every deployment (e.g. disk & memory aren't shared across hosts),
+        # so there's no default
+        match config("GUI_BLOB_STORE", ""):
+            case "redis":
+                _blob_store = RedisBlobStore()
+            case "disk":
+                _blob_store = LocalDiskBlobStore(
+                    config("GUI_BLOB_DIR", ".gooey-gui/blobs"),
+                    # 0 = unlimited
+                    max_bytes=config(
+                        "GUI_BLOB_DISK_MAX_BYTES", 1024 * 1024 * 1024, cast=int
+                    )
+                    or None,
+                )
+            case "memory":
+                _blob_store = MemoryBlobStore()
+            case "":
+                raise ValueError(
+                    "GUI_BLOB_STORE must be set to use GUI_BLOB_THRESHOLD: "
+                    "'redis' for multiple hosts, 'disk' for a single host, "
+                    "or 'memory' for a single worker"
+                )
+            case other:
+                raise ValueError(f"Unknown GUI_BLOB_STORE={other!r}")
+    return _blob_store
+
+
+def set_blob_store(store: BlobStore):
+    global _blob_store
+    _blob_store = store
+
+
+def is_blob_ref(value: typing.Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and BLOB_REF_KEY in value
+
+
+def put_blob(value: typing.Any, data: bytes | None = None) -> str:
+    if data is None:
+        data = dumps(value)
+    digest = hashlib.sha256(data).hexdigest()
+    get_blob_store().put(digest, data)
+    return digest
+
+
+def load_blob(digest: str) -> typing.Any:
+    """Raises `KeyError` if the blob has expired or was evicted."""
+    data = get_blob_store().get(digest)
+    if data is None:
+        logger.warning(f"blob not found {digest=}")
+        raise KeyError(digest)
+    return loads(data)
+
+
+class LazyBlobState(dict):
+    """
+    A session state that loads offloaded values from the blob store
+    the first time they are read.
+
+    If a blob is gone, its key is dropped, as if it was never set,
+    so that e.g. `cache_in_session_state` recomputes the value.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # key -> (digest, value) of the values that were loaded from the blob store
+        self.loaded: dict[str, tuple[str, typing.Any]] = {}
+
+    def _load(self, key: str, value: typing.Any) -> typing.Any:
+        if not is_blob_ref(value):
+            return value
+        digest = value[BLOB_REF_KEY]
+        try:
+            value = _wrap_refs(load_blob(digest))
+        except KeyError:
+            dict.pop(self, key, None)
+            raise KeyError(key) from None
+        dict.__setitem__(self, key, value)
+        self.loaded[key] = (digest, value)
+        return value
+
+    def __getitem__(self, key: str) -> typing.Any:
+        return self._load(key, super().__getitem__(key))
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key: str, default: typing.Any = None) -> typing.Any:
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def pop(self, key: str, *args) -> typing.Any:
+        try:
+            value = self[key]
+        except KeyError:
+            return super().pop(key, *args)
+        super().pop(key)
+        return value
+
+    def values(self):
+        return [value for _, value in self.items()]
+
+    def items(self):
+        items = []
+        # copy the keys, since missing blobs are dropped while iterating
+        for key in list(self):
+            try:
+                items.append((key, self[key]))
+            except KeyError:
+                pass
+        return items
+
+
+def _wrap_refs(value: typing.Any) -> typing.Any:
+    if isinstance(value, dict) and not isinstance(value, LazyBlobState):
+        if any(is_blob_ref(v) for v in value.values()):
+            return LazyBlobState(value)
+    return value
+
+
+def load_state(state: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    """Wrap an incoming session state so that blob references are resolved lazily."""
+    if not BLOB_THRESHOLD:
+        return state
+    state = LazyBlobState(state)
+    for key, value in dict.items(state):
+        dict.__setitem__(state, key, _wrap_refs(value))
+    return state
+
+
+async def aload_state(state: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    """
+    Same as `load_state()`, for async renders.
+    The referenced blobs are all fetched up front, without blocking the event loop,
+    since reading them lazily from the render would block it.
+    """
+    state = load_state(state)
+    if not isinstance(state, LazyBlobState):
+        return state
+    refs = []
+    for key, value in dict.items(state):
+        if isinstance(value, LazyBlobState):
+            refs.extend((value, k, v) for k, v in dict.items(value) if is_blob_ref(v))
+        elif is_blob_ref(value):
+            refs.append((state, key, value))
+    if not refs:
+        return state
+    store = get_blob_store()
+    digests = list({ref[BLOB_REF_KEY] for _, _, ref in refs})
+    blobs = dict(zip(digests, await asyncio.gather(*map(store.aget, digests))))
+    for parent, key, ref in refs:
+        digest = ref[BLOB_REF_KEY]
+        data = blobs[digest]
+        if data is None:
+            logger.warning(f"blob not found {digest=}")
+            # same as a missing key, see `LazyBlobState`
+            dict.pop(parent, key, None)
+            continue
+        value = _wrap_refs(loads(data))
+        dict.__setitem__(parent, key, value)
+        parent.loaded[key] = (digest, value)
+    return state
+
+
+def offload_state(
+    state: dict[str, typing.Any], depth: int = 2
+) -> dict[str, typing.Any]:
+    """
+    Replace the values in the session state that are larger than `GUI_BLOB_THRESHOLD`
+    with references to the blob store. Nested dicts (e.g. the `cache_in_session_state` cache)
+    are offloaded value by value, up to `depth` levels deep.
+    """
+    if not BLOB_THRESHOLD:
+        return state
+    blobs = {}
+    out = _offload(state, depth, blobs)
+    store = get_blob_store()
+    for digest, data in blobs.items():
+        store.put(digest, data)
+    return out
+
+
+async def aoffload_state(
+    state: dict[str, typing.Any], depth: int = 2
+) -> dict[str, typing.Any]:
+    """Same as `offload_state()`, without blocking the event loop."""
+    if not BLOB_THRESHOLD:
+        return state
+    blobs = {}
+    out = _offload(state, depth, blobs)
+    store = get_blob_store()
+    await asyncio.gather(*(store.aput(digest, data) for digest, data in blobs.items()))
+    return out
+
+
+def _offload(
+    state: dict[str, typing.Any], depth: int, blobs: dict[str, bytes]
+) -> dict[str, typing.Any]:
+    # collects the blobs to store in `blobs`, so that callers can store them in one go
+    loaded = state.loaded if isinstance(state, LazyBlobState) else {}
+    out = {}
+    for key, value in dict.items(state):
+        if is_blob_ref(value):
+            # never read during this render, pass it back as is
+            out[key] = value
+        elif isinstance(value, str) and loaded.get(key, (None, None))[1] is value:
+            # unchanged since it was loaded, no need to hash & store it again
+            out[key] = {BLOB_REF_KEY: loaded[key][0]}
+        elif isinstance(value, dict) and depth > 1:
+            out[key] = _offload(value, depth - 1, blobs)
+        elif value is None or isinstance(value, (bool, int, float)) or (
+            # a str can't possibly encode to more than 6 bytes per char
+            isinstance(value, str) and len(value) * 6 <= BLOB_THRESHOLD
+        ):
+            out[key] = value
+        else:
+            data = dumps(value)
+            if len(data) > BLOB_THRESHOLD:
+                digest = hashlib.sha256(data).hexdigest()
+                if digest != loaded.get(key, (None, None))[0]:
+                    # changed since it was loaded (or new), otherwise it's already stored
+                    blobs[digest] = data
+                out[key] = {BLOB_REF_KEY: digest}
+            else:
+                out[key] = value
+    return out
@@ -0,0 +1,118 @@
+import threading
+import typing
+from collections import OrderedDict
+from time import monotonic
+
+K = typing.TypeVar("K")
+V = typing.TypeVar("V")
+
+
+class CacheInfo(typing.NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+    nbytes: int
+
+
+class LRUCache(typing.Generic[K, V]):
+    """
+    A thread-safe, process-wide least-recently-used mapping.
+
+    Entries are evicted when there are more than `maxsize` of them,
+    when their total size (as measured by `sizeof`) exceeds `max_bytes`,
+    or when they're older than `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 128,
+        *,
+        max_bytes: int | None = None,
+        ttl: float | None = None,
+        sizeof: typing.Callable[[V], int] | None = None,
+    ):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        # key -> (value, size, expires_at)
+        self._data: OrderedDict[K, tuple[V, int, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            try:
+                value, size, expires_at = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and expires_at < monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: K, value: V, ttl: float | None = None):
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # would evict everything else and still not fit
+            self.pop(key)
+            return
+        ttl = ttl or self.ttl
+        expires_at = monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (
+                self.max_bytes is not None and self.nbytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key: K, default: V | None = None) -> V | None:
+        with self._lock:
+            try:
+                return self._remove(key)
+            except KeyError:
+                return default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            maxsize=self.maxsize,
+            currsize=len(self._data),
+            nbytes=self.nbytes,
+        )
+
+    def _remove(self, key: K) -> V:
+        value, size, _ = self._data.pop(key)
+        self.nbytes -= size
+        return value
+
+    def __contains__(self, key: K) -> bool:
+        """Like `get()`, expired entries are dropped, but hits aren't counted or moved to the end."""
+        with self._lock:
+            try:
+                expires_at = self._data[key][2]
+            except KeyError:
+                return False
+            if expires_at is not None and expires_at < monotonic():
+                self._remove(key)
+                return False
+            return True
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,128 @@
+import typing
+import zlib
+
+from decouple import config
+
+from .encoder import _default, dumps, loads
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Tagged values start with a byte that plain JSON never starts with,
+# followed by the format & compression, e.g. b"\x00mz" is zlib compressed msgpack.
+# Untagged values are plain JSON, as written by older versions.
+HEADER_MAGIC = b"\x00"
+FORMATS = {"json": b"j", "msgpack": b"m"}
+COMPRESSIONS = {"none": b"-", "zlib": b"z", "zstd": b"s"}
+
+
+class ChannelCodec:
+    """
+    Encodes the values of realtime channels.
+
+    Values that encode to more than `compress_bytes` are compressed, if that makes them smaller.
+    With the defaults (json, below the threshold) the output is plain JSON,
+    so older readers can still decode it.
+    """
+
+    def __init__(
+        self,
+        format: str = config("GUI_CHANNEL_FORMAT", "json"),
+        compression: str = config(
+            "GUI_CHANNEL_COMPRESSION", "zstd" if zstandard else "zlib"
+        ),
+        compress_bytes: int = config("GUI_CHANNEL_COMPRESS_BYTES", 4096, cast=int),
+    ):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown GUI_CHANNEL_FORMAT={format!r}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown GUI_CHANNEL_COMPRESSION={compression!r}")
+        if format == "msgpack" and msgpack is None:
+            raise ImportError(
+                "GUI_CHANNEL_FORMAT=msgpack requires `pip install msgpack`"
+            )
+        if compression == "zstd" and zstandard is None:
+            raise ImportError(
+                "GUI_CHANNEL_COMPRESSION=zstd requires `pip install zstandard`"
+            )
+        self.format = format
+        self.compression = compression
+        self.compress_bytes = compress_bytes
+
+    def encode(self, value: typing.Any) -> bytes:
+        if self.format == "msgpack":
+            data = msgpack.packb(value, default=_default, strict_types=False)
+        else:
+            data = dumps(value)
+        compression = "none"
+        if self.compression != "none" and len(data) > self.compress_bytes:
+            compressed = _compress(data, self.compression)
+            if len(compressed) < len(data):
+                data = compressed
+                compression = self.compression
+        if self.format == "json" and compression == "none":
+            return data
+        return HEADER_MAGIC + FORMATS[self.format] + COMPRESSIONS[compression] + data
+
+    def decode(self, data: bytes | None) -> typing.Any:
+        return decode_channel_value(data)
+
+
+def decode_channel_value(data: bytes | None) -> typing.Any:
+    """Decode a value written by any `ChannelCodec`, or plain JSON."""
+    if not data:
+        return None
+    if not data.startswith(HEADER_MAGIC):
+        return loads(data)
+    fmt, compression, data = data[1:2], data[2:3], data[3:]
+    match compression:
+        case b"-":
+            pass
+        case b"z":
+            data = zlib.decompress(data)
+        case b"s":
+            if zstandard is None:
+                raise ImportError(
+                    "Decoding this value requires `pip install zstandard`"
+                )
+            data = zstandard.ZstdDecompressor().decompress(data)
+        case _:
+            raise ValueError(f"Unknown channel value compression {compression!r}")
+    match fmt:
+        case b"j":
+            return loads(data)
+        case b"m":
+            if msgpack is None:
+                raise ImportError("Decoding this value requires `pip install msgpack`")
+            return msgpack.unpackb(data, strict_map_key=False)
+        case _:
+            raise ValueError(f"Unknown channel value format {fmt!r}")
+
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        # compressors aren't thread-safe, and cheap to create
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+
+_channel_codec: ChannelCodec | None = None
+
+
+def get_channel_codec() -> ChannelCodec:
+    global _channel_codec
+    if _channel_codec is None:
+        _channel_codec = ChannelCodec()
+    return _channel_codec
+
+
+def set_channel_codec(codec: ChannelCodec):
+    global _channel_codec
+    _channel_codec = codec
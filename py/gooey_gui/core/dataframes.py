@@ -0,0 +1,121 @@
+import hashlib
+import typing
+
+from decouple import config
+from starlette.responses import Response
+
+from .arrays import encode_typed_array
+from .cache import LRUCache
+from .encoder import dumps
+from .endpoints import expired, router, url_for
+from .keys import hash_values
+
+if typing.TYPE_CHECKING:
+    import pandas as pd
+
+# frames with more rows than this are sent in windows, if the endpoints are mounted
+DATAFRAME_INLINE_ROWS = config("GUI_DATAFRAME_INLINE_ROWS", 1000, cast=int)
+# rows per window fetched by the client, and sent along with the page.
+# Passed to the client as the `pageSize` prop, which it uses as the grid's `cacheBlockSize`
+DATAFRAME_PAGE_ROWS = config("GUI_DATAFRAME_PAGE_ROWS", 100, cast=int)
+# max rows returned by a single request to the dataframes endpoint
+MAX_DATAFRAME_PAGE = config("GUI_MAX_DATAFRAME_PAGE", 5000, cast=int)
+
+_frames: LRUCache[str, "pd.DataFrame"] = LRUCache(
+    maxsize=config("GUI_DATAFRAME_CACHE_MAXSIZE", 64, cast=int),
+    max_bytes=config("GUI_DATAFRAME_CACHE_MAX_BYTES", 1024 * 1024 * 1024, cast=int),
+    ttl=config("GUI_DATAFRAME_CACHE_TTL", 3600, cast=float),
+    # deep, since object & string columns are mostly the contents of their values
+    sizeof=lambda df: int(df.memory_usage(index=True, deep=True).sum()),
+)
+
+
+def encode_frame(
+    df: "pd.DataFrame", offset: int = 0, limit: int | None = None, index: bool = True
+) -> dict[str, typing.Any]:
+    """
+    Encode the rows `[offset, offset + limit)` of `df` column by column.
+    Numeric & boolean columns are sent as typed arrays, everything else as json lists.
+    """
+    window = df.iloc[offset : None if limit is None else offset + limit]
+    columns = []
+    if index:
+        columns.append(_encode_column(window.index.name or "", window.index))
+    for name, series in window.items():
+        columns.append(_encode_column(name, series))
+    return {"columns": columns, "index": index, "offset": offset, "total": len(df)}
+
+
+def _encode_column(name: typing.Any, values) -> dict[str, typing.Any]:
+    col = {"name": str(name)}
+    if values.dtype.kind in "iuf":
+        # nullable extension dtypes (e.g. Int64 with missing values) come out as objects
+        encoded = encode_typed_array(values.to_numpy())
+        if encoded:
+            col.update(encoded)
+            return col
+    col["values"] = [
+        None if _isna(value) else value if _is_json_scalar(value) else str(value)
+        for value in values.tolist()
+    ]
+    return col
+
+
+def _isna(value: typing.Any) -> bool:
+    import pandas as pd
+
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        # e.g. lists, which pd.isna() checks element-wise
+        return False
+
+
+def _is_json_scalar(value: typing.Any) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+
+def frame_handle(df: "pd.DataFrame") -> str:
+    import pandas as pd
+
+    h = hashlib.md5()
+    h.update(pd.util.hash_pandas_object(df.index).to_numpy().tobytes())
+    for _, series in df.items():
+        try:
+            values = pd.util.hash_pandas_object(series, index=False)
+        except TypeError:
+            # e.g. object columns holding lists or dicts
+            values = pd.util.hash_pandas_object(series.map(repr), index=False)
+        h.update(values.to_numpy().tobytes())
+    return hash_values("dataframe", list(map(str, df.columns)), h.hexdigest())
+
+
+def register_frame(df: "pd.DataFrame") -> str | None:
+    """
+    Register `df` to be served in windows by the dataframes endpoint,
+    and return the endpoint's url.
+
+    Returns `None` if the frame should be sent inline instead,
+    i.e. it's small, or the endpoints aren't mounted.
+    """
+    if len(df) <= DATAFRAME_INLINE_ROWS or url_for("/dataframes") is None:
+        return None
+    handle = frame_handle(df)
+    if _frames.get(handle) is None:
+        # only measured once, when it's inserted
+        _frames.set(handle, df)
+    return url_for(f"/dataframes/{handle}")
+
+
+@router.get("/dataframes/{handle}")
+def gooey_gui_dataframe(
+    handle: str, offset: int = 0, limit: int = 500, index: bool = True
+):
+    df = _frames.get(handle)
+    if df is None:
+        raise expired("Dataframe")
+    limit = max(0, min(limit, MAX_DATAFRAME_PAGE))
+    return Response(
+        dumps(encode_frame(df, max(0, offset), limit, index=index)),
+        media_type="application/json",
+    )
@@ -0,0 +1,293 @@
+import asyncio
+import threading
+import typing
+from collections import OrderedDict
+from time import monotonic, sleep
+
+from decouple import config
+from loguru import logger
+
+DISPATCHER_POLL_TIMEOUT = config("GUI_DISPATCHER_POLL_TIMEOUT", 0.1, cast=float)
+# max seconds that entering a subscription waits for it to be active upstream
+DISPATCHER_SUBSCRIBE_TIMEOUT = config("GUI_DISPATCHER_SUBSCRIBE_TIMEOUT", 5, cast=float)
+
+
+class Subscription:
+    """
+    A set of channels that a single consumer listens to, see `LocalDispatcher.subscribe()`.
+
+    Only the latest message of each channel is kept until it's read,
+    so slow consumers never fall behind. Superseded messages are counted in `dropped`.
+    Supports sync & async iteration over `(channel, message)` tuples.
+
+    Entering it as a (async) context manager waits until the channels are active upstream,
+    so that nothing published after that is missed.
+    """
+
+    def __init__(self, dispatcher: "LocalDispatcher", channels: set[str]):
+        self.dispatcher = dispatcher
+        self.channels = channels
+        self.dropped = 0
+        self.closed = False
+        self._pending: OrderedDict[str, bytes] = OrderedDict()
+        self._cond = threading.Condition()
+        # set by async consumers, to be woken up from the dispatcher thread
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def _deliver(self, channel: str, message: bytes):
+        with self._cond:
+            if channel in self._pending:
+                self.dropped += 1
+                del self._pending[channel]
+            self._pending[channel] = message
+            self._cond.notify_all()
+            waiters = self._waiters
+            self._waiters = []
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _pop(self) -> tuple[str, bytes] | None:
+        if self._pending:
+            return self._pending.popitem(last=False)
+        return None
+
+    def get(self, timeout: float | None = None) -> tuple[str, bytes] | None:
+        """Wait for the next message. Returns `None` on timeout, or if closed."""
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            while not self.closed:
+                item = self._pop()
+                if item:
+                    return item
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+        return None
+
+    async def aget(self, timeout: float | None = None) -> tuple[str, bytes] | None:
+        """Same as `get()`, without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not self.closed:
+            remaining = None if deadline is None else deadline - loop.time()
+            with self._cond:
+                item = self._pop()
+                if item:
+                    return item
+                if remaining is not None and remaining <= 0:
+                    return None
+                waiter = (loop, asyncio.Event())
+                self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(waiter[1].wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                # e.g. on timeout, so that idle connections don't pile up dead waiters
+                with self._cond:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        # already taken by `_deliver()` or `close()`
+                        pass
+        return None
+
+    def wait_active(self, timeout: float = DISPATCHER_SUBSCRIBE_TIMEOUT) -> bool:
+        """Wait until the channels are subscribed upstream. Returns `False` on timeout."""
+        return self.dispatcher._wait_active(self.channels, timeout)
+
+    async def await_active(self, timeout: float = DISPATCHER_SUBSCRIBE_TIMEOUT) -> bool:
+        """Same as `wait_active()`, without blocking the event loop."""
+        if self.dispatcher._wait_active(self.channels, 0):
+            return True
+        return await asyncio.to_thread(self.wait_active, timeout)
+
+    def __iter__(self) -> typing.Iterator[tuple[str, bytes]]:
+        while (item := self.get()) is not None:
+            yield item
+
+    async def __aiter__(self) -> typing.AsyncIterator[tuple[str, bytes]]:
+        while (item := await self.aget()) is not None:
+            yield item
+
+    def close(self):
+        if self.closed:
+            return
+        self.dispatcher._unsubscribe(self)
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+            waiters = self._waiters
+            self._waiters = []
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def __enter__(self) -> "Subscription":
+        self.wait_active()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def __aenter__(self) -> "Subscription":
+        await self.await_active()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class LocalDispatcher:
+    """
+    Fans messages out to any number of local `Subscription`s, e.g. for the in-memory backend.
+    Channels are refcounted, so subclasses can (un)subscribe them upstream
+    when the first local subscriber needs them, and when the last one is closed.
+    """
+
+    def __init__(self):
+        # channel -> local subscriptions
+        self._subs: dict[str, set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels: typing.Iterable[str]) -> Subscription:
+        """
+        Start listening to `channels` (full channel names).
+        Messages published before the subscription is active upstream are missed,
+        so enter it with `with` / `async with` (or call `wait_active()`),
+        and read the current values of the channels after that.
+        """
+        sub = Subscription(self, set(channels))
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._subs.setdefault(channel, set())
+                if not subs:
+                    self._channel_added(channel)
+                subs.add(sub)
+        return sub
+
+    def _unsubscribe(self, sub: Subscription):
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._subs.get(channel)
+                if not subs:
+                    continue
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[channel]
+                    self._channel_removed(channel)
+
+    def _channel_added(self, channel: str):
+        pass
+
+    def _channel_removed(self, channel: str):
+        pass
+
+    def _wait_active(self, channels: typing.Iterable[str], timeout: float) -> bool:
+        # local channels are active as soon as they're subscribed
+        return True
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len({sub for subs in self._subs.values() for sub in subs})
+
+    def fan_out(self, channel: str, message: bytes):
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        for sub in subs:
+            sub._deliver(channel, message)
+
+
+class RealtimeDispatcher(LocalDispatcher):
+    """
+    Owns a single redis pubsub connection per process, and fans its messages out
+    to any number of local `Subscription`s.
+
+    Channels are subscribed when the first local subscriber needs them,
+    and unsubscribed when the last one is closed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # (un)subscribe commands for the listener thread, since redis pubsub isn't thread-safe
+        self._ops: list[tuple[str, str]] = []
+        self._thread: threading.Thread | None = None
+        # channel -> set once redis has confirmed the subscription
+        self._active: dict[str, threading.Event] = {}
+
+    def _channel_added(self, channel: str):
+        self._active[channel] = threading.Event()
+        self._ops.append(("subscribe", channel))
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="gooey-gui-dispatcher", daemon=True
+            )
+            self._thread.start()
+
+    def _channel_removed(self, channel: str):
+        self._active.pop(channel, None)
+        self._ops.append(("unsubscribe", channel))
+
+    def _wait_active(self, channels: typing.Iterable[str], timeout: float) -> bool:
+        deadline = monotonic() + timeout
+        for channel in channels:
+            with self._lock:
+                event = self._active.get(channel)
+            if event is None or event.is_set():
+                continue
+            if not event.wait(max(0.0, deadline - monotonic())):
+                if timeout:
+                    logger.warning(
+                        f"timed out waiting for redis to subscribe {channel=}"
+                    )
+                return False
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logger.warning(f"realtime dispatcher disconnected, reconnecting {e!r}")
+                sleep(1)
+
+    def _listen(self):
+        from .pubsub import get_redis
+
+        pubsub = get_redis().pubsub()
+        with self._lock:
+            # (re)subscribe everything, e.g. after a reconnect
+            self._ops = [("subscribe", channel) for channel in self._subs]
+            for event in self._active.values():
+                event.clear()
+        try:
+            while True:
+                with self._lock:
+                    ops, self._ops = self._ops, []
+                for op, channel in ops:
+                    getattr(pubsub, op)(channel)
+                if not pubsub.subscribed:
+                    sleep(DISPATCHER_POLL_TIMEOUT)
+                    continue
+                message = pubsub.get_message(timeout=DISPATCHER_POLL_TIMEOUT)
+                if not message or message["type"] not in ("message", "subscribe"):
+                    continue
+                channel = message["channel"]
+                if isinstance(channel, bytes):
+                    channel = channel.decode()
+                if message["type"] == "subscribe":
+                    with self._lock:
+                        event = self._active.get(channel)
+                    if event:
+                        event.set()
+                    continue
+                self.fan_out(channel, message["data"])
+        finally:
+            pubsub.close()
+
+
+def get_dispatcher() -> LocalDispatcher:
+    """The dispatcher of the current realtime backend, shared by the whole process."""
+    from .realtime_backend import get_realtime_backend
+
+    return get_realtime_backend().dispatcher
@@ -0,0 +1,112 @@
+import dataclasses
+import datetime
+import decimal
+import enum
+import json
+import typing
+import uuid
+from pathlib import PurePath
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+T = typing.TypeVar("T")
+Encoder = typing.Callable[[typing.Any], typing.Any]
+
+_encoders: dict[type, Encoder] = {}
+
+
+def register_encoder(cls: type, fn: Encoder | None = None):
+    """
+    Register a function that converts instances of `cls` (and its subclasses)
+    into JSON-compatible values. Can be used as a decorator.
+
+    Example:
+        @gui.register_encoder(MyModel)
+        def encode_my_model(obj: MyModel):
+            return obj.to_json()
+    """
+
+    def decorator(fn: Encoder) -> Encoder:
+        _encoders[cls] = fn
+        return fn
+
+    if fn:
+        return decorator(fn)
+    else:
+        return decorator
+
+
+def dumps(obj: typing.Any) -> bytes:
+    """
+    Serialize `obj` to JSON bytes in a single pass.
+
+    Uses orjson if it's installed, otherwise falls back to the stdlib json module.
+    Types that aren't natively supported are converted with the functions
+    registered using `register_encoder()`.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                obj,
+                default=_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            # e.g. integers that don't fit in 64 bits, fall back to stdlib
+            pass
+    return json.dumps(
+        obj, default=_default, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def loads(data: bytes | str) -> typing.Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_object(obj: dict[str, typing.Any], **encoded: bytes) -> bytes:
+    """
+    Like `dumps(obj)`, but also splices in fields whose values are already encoded JSON,
+    so that large values (e.g. the render tree) never have to be serialized twice.
+    """
+    parts = [dumps(key) + b":" + value for key, value in encoded.items()]
+    if obj:
+        parts.append(dumps(obj)[1:-1])
+    return b"{" + b",".join(parts) + b"}"
+
+
+def _default(obj: typing.Any) -> typing.Any:
+    for cls in type(obj).__mro__:
+        try:
+            fn = _encoders[cls]
+        except KeyError:
+            continue
+        return fn(obj)
+    if dataclasses.is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    if hasattr(obj, "model_dump"):
+        # pydantic v2
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "tolist"):
+        # numpy arrays & scalars
+        return obj.tolist()
+
+    from fastapi.encoders import jsonable_encoder
+
+    return jsonable_encoder(obj)
+
+
+register_encoder(datetime.date, lambda obj: obj.isoformat())
+register_encoder(datetime.time, lambda obj: obj.isoformat())
+register_encoder(datetime.timedelta, datetime.timedelta.total_seconds)
+register_encoder(decimal.Decimal, float)
+register_encoder(enum.Enum, lambda obj: obj.value)
+register_encoder(uuid.UUID, str)
+register_encoder(PurePath, str)
+register_encoder(set, list)
+register_encoder(frozenset, list)
+register_encoder(bytes, lambda obj: obj.decode())
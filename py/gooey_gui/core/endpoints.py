@@ -0,0 +1,63 @@
+import os
+
+from decouple import config
+from fastapi import APIRouter, HTTPException
+from loguru import logger
+
+router = APIRouter(include_in_schema=False)
+
+# the number of server processes, as set for gunicorn & uvicorn
+WEB_CONCURRENCY = config("WEB_CONCURRENCY", 1, cast=int)
+
+_mount_prefix: str | None = None
+
+
+def mount(
+    app,
+    prefix: str = "/__/gui",
+    *,
+    sticky: bool = config("GUI_STICKY_SESSIONS", False, cast=bool),
+):
+    """
+    Serve gooey-gui's built-in endpoints (stylesheets, images, paged options, etc.) on `app`.
+
+    Until this is called, components fall back to inlining their data in the render tree.
+
+    Paged options, tables, dataframes and lazily loaded json are kept in the memory of the
+    process that rendered them, and only that process can serve them.
+    So with multiple workers, requests from a client must always reach the same worker
+    (sticky sessions), which you confirm by passing `sticky=True` or setting `GUI_STICKY_SESSIONS=1`.
+    Otherwise, mounting with `WEB_CONCURRENCY` > 1 raises an error.
+    Images and stylesheets are only linked to when their stores are shared by all workers
+    (see `GUI_IMAGE_STORE` and `GUI_STYLES_STORE`), and are inlined otherwise.
+    """
+    global _mount_prefix
+    if WEB_CONCURRENCY > 1 and not sticky:
+        raise RuntimeError(
+            f"WEB_CONCURRENCY={WEB_CONCURRENCY}, but gooey-gui's built-in endpoints "
+            "can only be served by the process that rendered the page. "
+            "Use sticky sessions and pass `sticky=True` to `gui.mount()`, or don't mount them."
+        )
+    app.include_router(router, prefix=prefix)
+    _mount_prefix = prefix
+
+
+def url_for(path: str) -> str | None:
+    """Returns the URL of a built-in endpoint, or `None` if they are not mounted."""
+    if _mount_prefix is None:
+        return None
+    return _mount_prefix + path
+
+
+def expired(what: str) -> HTTPException:
+    """
+    The error for a value kept in this process that's not found,
+    i.e. it was evicted, or the request reached a different worker than the render did.
+    """
+    logger.warning(
+        f"{what} not found in process {os.getpid()}, "
+        "with multiple workers, requests must be sticky (see `gui.mount()`)"
+    )
+    return HTTPException(
+        status_code=404, detail=f"{what} expired, please reload the page"
+    )
@@ -22,6 +22,13 @@ class RerunException(Exception):
     pass
 
 
+class RerunLimitExceeded(RuntimeError):
+    def __init__(self, route: str, reruns: int):
+        self.route = route
+        self.reruns = reruns
+        super().__init__(f"{route!r} was rerun {reruns} times in a single render")
+
+
 def rerun():
     raise RerunException()
 
@@ -0,0 +1,171 @@
+import base64
+import hashlib
+import io
+import typing
+
+from decouple import config
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .blob_store import (
+    BlobStore,
+    LocalDiskBlobStore,
+    MemoryBlobStore,
+    RedisBlobStore,
+    is_valid_digest,
+)
+from .endpoints import router, url_for
+
+# the format that numpy & PIL images are encoded to: png, webp or jpeg
+IMAGE_FORMAT = config("GUI_IMAGE_FORMAT", "png")
+# for webp & jpeg
+IMAGE_QUALITY = config("GUI_IMAGE_QUALITY", 85, cast=int)
+
+_MEDIA_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+}
+_MAGIC_BYTES = [
+    (b"\x89PNG", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF8", "gif"),
+    (b"RIFF", "webp"),
+]
+
+_image_store: BlobStore | None = None
+
+
+def get_image_store() -> BlobStore:
+    global _image_store
+    if _image_store is None:
+        match config("GUI_IMAGE_STORE", "memory"):
+            case "redis":
+                _image_store = RedisBlobStore(
+                    ex=config("GUI_IMAGE_TTL", 24 * 60 * 60, cast=int)
+                )
+            case "disk":
+                _image_store = LocalDiskBlobStore(
+                    config("GUI_IMAGE_DIR", ".gooey-gui/images"),
+                    max_bytes=config(
+                        "GUI_IMAGE_DISK_MAX_BYTES", 1024 * 1024 * 1024, cast=int
+                    ),
+                )
+            case "memory":
+                _image_store = MemoryBlobStore(
+                    maxsize=config("GUI_IMAGE_CACHE_MAXSIZE", 10_000, cast=int),
+                    max_bytes=config(
+                        "GUI_IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024, cast=int
+                    ),
+                    ttl=None,
+                )
+            case other:
+                raise ValueError(f"Unknown GUI_IMAGE_STORE={other!r}")
+    return _image_store
+
+
+def set_image_store(store: BlobStore):
+    global _image_store
+    _image_store = store
+
+
+def image_src(img: typing.Any, height: int | None = None) -> str:
+    """
+    Returns a `src` for a numpy array, PIL image or the bytes of an encoded image.
+
+    Images are encoded once and kept in the image store, keyed by a hash of their contents.
+    The `src` is a url to the images endpoint, or a data uri if it's not mounted,
+    or the image store isn't shared by all workers (the default in-memory store).
+    """
+    digest, fmt, encode = _image_key(img, height)
+    store = get_image_store()
+    data = None
+    if not store.exists(digest):
+        data = encode()
+        store.put(digest, data)
+    url = url_for(f"/images/{digest}.{fmt}")
+    if url and store.shared:
+        return url
+    if data is None:
+        data = store.get(digest) or encode()
+    return f"data:{_MEDIA_TYPES[fmt]};base64," + base64.b64encode(data).decode()
+
+
+def _image_key(
+    img: typing.Any, height: int | None
+) -> tuple[str, str, typing.Callable[[], bytes]]:
+    """Returns the (digest, format, encode function) for an image."""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(img, (bytes, bytearray, memoryview)):
+        img = bytes(img)
+        fmt = _sniff_format(img)
+        h.update(img)
+        return h.hexdigest(), fmt, lambda: img
+    fmt = IMAGE_FORMAT
+    h.update(repr((fmt, IMAGE_QUALITY, height)).encode())
+    if _is_pil_image(img):
+        h.update(repr((img.mode, img.size)).encode())
+        h.update(img.tobytes())
+        return h.hexdigest(), fmt, lambda: _encode_pil_img(img, fmt)
+    h.update(repr((img.dtype.str, img.shape)).encode())
+    h.update(img.tobytes())
+    return h.hexdigest(), fmt, lambda: _encode_cv2_img(img, fmt, height)
+
+
+def _sniff_format(data: bytes) -> str:
+    for magic, fmt in _MAGIC_BYTES:
+        if data.startswith(magic):
+            return fmt
+    raise ValueError("Unsupported image format")
+
+
+def _is_pil_image(img: typing.Any) -> bool:
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    return isinstance(img, Image.Image)
+
+
+def _encode_cv2_img(img, fmt: str, height: int | None) -> bytes:
+    import cv2
+
+    if height:
+        h, w = img.shape[:2]
+        img = cv2.resize(img, (int(w * height / h), height))
+    match fmt:
+        case "webp":
+            params = [cv2.IMWRITE_WEBP_QUALITY, IMAGE_QUALITY]
+        case "jpeg":
+            params = [cv2.IMWRITE_JPEG_QUALITY, IMAGE_QUALITY]
+        case _:
+            params = []
+    return cv2.imencode("." + fmt, img, params)[1].tobytes()
+
+
+def _encode_pil_img(img, fmt: str) -> bytes:
+    if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    f = io.BytesIO()
+    img.save(f, format=fmt.upper(), quality=IMAGE_QUALITY)
+    return f.getvalue()
+
+
+@router.get("/images/{digest}.{ext}")
+def gooey_gui_image(request: Request, digest: str, ext: str):
+    media_type = _MEDIA_TYPES.get(ext)
+    if not media_type or not is_valid_digest(digest):
+        raise HTTPException(status_code=404)
+    headers = {
+        "ETag": f'"{digest}"',
+        # the url changes whenever the image does
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    data = get_image_store().get(digest)
+    if data is None:
+        raise HTTPException(status_code=404)
+    return Response(data, media_type=media_type, headers=headers)
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import sys
+import typing
+
+from decouple import config
+
+from .cache import LRUCache
+from .state import localctx
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# derive widget keys from the line of code that created them, instead of their options
+CALLSITE_KEYS = config("GUI_CALLSITE_KEYS", False, cast=bool)
+
+_package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+# sequences shorter than this are cheaper to hash than to look up
+_MIN_CACHED_LEN = 64
+# id(seq) -> (seq, digest). Holding a reference to `seq` keeps its id from being reused
+_seq_hashes: LRUCache[int, tuple[tuple, str]] = LRUCache(maxsize=1024)
+
+
+def _hasher():
+    """
+    The fastest available hash, for digests that are only used within this process,
+    e.g. cache keys. May differ between processes, depending on whether xxhash is installed.
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+
+def _key_hasher():
+    # pinned, since widget keys end up in session states that outlive this process
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_values(*values) -> str:
+    """
+    A fast hash of the `repr()` of `values`, that's stable across processes & deployments.
+
+    Tuples of 64 or more items (e.g. widget options kept in a module level constant)
+    are only hashed the first time they're seen, after that their hash is looked up by identity.
+    Lists, dicts and shorter tuples are hashed every time, since lists and dicts can be
+    mutated in place. Pass long options as a tuple to get the cached hash.
+    """
+    h = _key_hasher()
+    for value in values:
+        if type(value) is tuple and len(value) >= _MIN_CACHED_LEN:
+            h.update(_seq_hash(value).encode())
+        else:
+            h.update(repr(value).encode())
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+def _seq_hash(seq: tuple) -> str:
+    entry = _seq_hashes.get(id(seq))
+    if entry and entry[0] is seq:
+        return entry[1]
+    h = _key_hasher()
+    h.update(repr(seq).encode())
+    digest = h.hexdigest()
+    _seq_hashes.set(id(seq), (seq, digest))
+    return digest
+
+
+def widget_key(kind: str, *values, options: typing.Any = None) -> str:
+    """
+    Derive a key for a widget that wasn't given an explicit `key`.
+
+    With `GUI_CALLSITE_KEYS=1`, the key comes from the line of code that rendered the widget
+    (and how many times that line has rendered in this pass) instead of its `options`,
+    so the cost doesn't grow with the number of options.
+    """
+    if CALLSITE_KEYS:
+        return hash_values(kind, callsite(), *values)
+    if options is None:
+        return hash_values(kind, *values)
+    return hash_values(kind, *values, options)
+
+
+def callsite() -> str:
+    """
+    Returns `filename:lineno:n` of the first caller outside gooey_gui,
+    where `n` counts how many times that line was reached during the current render pass.
+    """
+    frame = sys._getframe(1)
+    while frame and frame.f_code.co_filename.startswith(_package_dir):
+        frame = frame.f_back
+    if frame is None:
+        return ""
+    site = f"{frame.f_code.co_filename}:{frame.f_lineno}"
+    try:
+        counts = localctx.callsite_counts
+    except AttributeError:
+        counts = localctx.callsite_counts = {}
+    n = counts[site] = counts.get(site, -1) + 1
+    return f"{site}:{n}"
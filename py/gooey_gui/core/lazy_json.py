@@ -0,0 +1,138 @@
+import json
+import typing
+
+from decouple import config
+from fastapi import HTTPException
+from starlette.responses import Response
+
+from .cache import LRUCache
+from .encoder import dumps
+from .endpoints import expired, router, url_for
+from .keys import _hasher, hash_values
+
+# values that encode to more than this many bytes are sent lazily
+JSON_LAZY_BYTES = config("GUI_JSON_LAZY_BYTES", 64 * 1024, cast=int)
+# max items of a list or dict, and chars of a string, that are sent at once
+JSON_PREVIEW_ITEMS = config("GUI_JSON_PREVIEW_ITEMS", 100, cast=int)
+JSON_PREVIEW_CHARS = config("GUI_JSON_PREVIEW_CHARS", 1000, cast=int)
+JSON_REF_KEY = "__gui_json_ref__"
+
+# handle -> (value, encoded size)
+_values: LRUCache[str, tuple[typing.Any, int]] = LRUCache(
+    maxsize=config("GUI_JSON_CACHE_MAXSIZE", 256, cast=int),
+    max_bytes=config("GUI_JSON_CACHE_MAX_BYTES", 256 * 1024 * 1024, cast=int),
+    ttl=config("GUI_JSON_CACHE_TTL", 600, cast=float),
+    sizeof=lambda entry: entry[1],
+)
+
+
+def lazy_json(
+    value: typing.Any, depth: int, key: str | None = None
+) -> tuple[str, typing.Any] | None:
+    """
+    Keep a large `value` around to be expanded through the json endpoint.
+    Returns the endpoint's url, and the top `depth` levels of the value to send right away.
+
+    Large dicts & lists are encoded and hashed on every render to identify them,
+    unless a `key` is given, which must change whenever the value does.
+
+    Returns `None` if the value is small enough to be sent as is, or the endpoints aren't mounted.
+    """
+    if not isinstance(value, (dict, list, tuple, str)) or url_for("/json") is None:
+        return None
+    data = None
+    if key is not None:
+        handle = hash_values("json", key)
+    elif isinstance(value, str):
+        # a str encodes to at least 1, and at most 6 bytes per char
+        if len(value) * 6 <= JSON_LAZY_BYTES:
+            return None
+        h = _hasher()
+        # so that a str can't collide with the encoding of some other value
+        h.update(b"str\x1f")
+        h.update(value.encode(errors="surrogatepass"))
+        handle = h.hexdigest()
+    else:
+        data = dumps(value)
+        if len(data) <= JSON_LAZY_BYTES:
+            return None
+        h = _hasher()
+        h.update(data)
+        handle = h.hexdigest()
+    entry = _values.get(handle)
+    if entry is None:
+        if data is None:
+            data = dumps(value)
+        if len(data) <= JSON_LAZY_BYTES:
+            return None
+        # round trip, so that paths use the same (str) keys as the client
+        entry = (json.loads(data), len(data))
+        _values.set(handle, entry)
+    return url_for(f"/json/{handle}"), truncate_json(entry[0], depth)
+
+
+def truncate_json(
+    value: typing.Any,
+    depth: int,
+    path: tuple = (),
+    offset: int = 0,
+) -> typing.Any:
+    """
+    Returns the top `depth` levels of `value`, starting at item `offset`.
+    Deeper nodes, long strings, and items past `JSON_PREVIEW_ITEMS` are replaced by references
+    that the client can expand via the json endpoint.
+    """
+    if isinstance(value, str):
+        if len(value) <= JSON_PREVIEW_CHARS:
+            return value
+        return _ref(path, value[:JSON_PREVIEW_CHARS] + "…", len(value))
+    if not isinstance(value, (dict, list)):
+        return value
+    if depth <= 0:
+        preview = "{…}" if isinstance(value, dict) else "[…]"
+        return _ref(path, preview, len(value))
+    stop = offset + JSON_PREVIEW_ITEMS
+    remaining = len(value) - stop
+    if isinstance(value, dict):
+        ret = {}
+        for i, (key, item) in enumerate(value.items()):
+            if i < offset:
+                continue
+            if i >= stop:
+                ret[f"… {remaining} more"] = _ref(path, "…", remaining, stop)
+                break
+            ret[key] = truncate_json(item, depth - 1, (*path, key))
+        return ret
+    ret = [
+        truncate_json(item, depth - 1, (*path, i))
+        for i, item in enumerate(value[offset:stop], start=offset)
+    ]
+    if remaining > 0:
+        ret.append(_ref(path, f"… {remaining} more", remaining, stop))
+    return ret
+
+
+def _ref(path: tuple, preview: str, size: int, offset: int = 0) -> dict:
+    return {
+        JSON_REF_KEY: {"path": path, "offset": offset, "preview": preview, "size": size}
+    }
+
+
+@router.get("/json/{handle}")
+def gooey_gui_json(handle: str, path: str = "[]", offset: int = 0, depth: int = 1):
+    entry = _values.get(handle)
+    if entry is None:
+        raise expired("Value")
+    value = entry[0]
+    try:
+        path = json.loads(path)
+        for key in path:
+            value = value[key]
+    except (ValueError, KeyError, IndexError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid path")
+    if isinstance(value, str):
+        # expanding a string shows all of it
+        ret = value
+    else:
+        ret = truncate_json(value, max(1, depth), tuple(path), max(0, offset))
+    return Response(dumps({"value": ret}), media_type="application/json")
@@ -0,0 +1,196 @@
+import threading
+import typing
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+
+from decouple import config
+from loguru import logger
+
+from .state import localctx
+
+MAX_RERUNS = config("GUI_MAX_RERUNS", 100, cast=int)
+
+RenderHook = typing.Callable[["RenderStats"], None]
+
+
+@dataclass
+class RenderStats:
+    route: str
+    # wall time of each render attempt, in seconds
+    attempt_seconds: list[float] = field(default_factory=list)
+    node_count: int = 0
+    response_bytes: int = 0
+    redis_calls: int = 0
+    status: typing.Literal["ok", "redirect", "rerun_limit", "error"] = "error"
+
+    @property
+    def reruns(self) -> int:
+        return max(len(self.attempt_seconds) - 1, 0)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.attempt_seconds)
+
+    @contextmanager
+    def attempt(self):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.attempt_seconds.append(perf_counter() - start)
+
+
+_render_hooks: list[RenderHook] = []
+
+
+def add_render_hook(fn: RenderHook) -> RenderHook:
+    """
+    Register a function to be called with the `RenderStats` at the end of every render.
+    Can be used as a decorator.
+    """
+    _render_hooks.append(fn)
+    return fn
+
+
+def remove_render_hook(fn: RenderHook):
+    _render_hooks.remove(fn)
+
+
+def start_render_stats(route: str) -> RenderStats:
+    localctx.render_stats = stats = RenderStats(route=route)
+    return stats
+
+
+def count_redis_calls(n: int = 1):
+    """Count the redis round trips made during the current render, if any."""
+    try:
+        localctx.render_stats.redis_calls += n
+    except AttributeError:
+        pass
+
+
+def report_render(stats: RenderStats):
+    for fn in _render_hooks:
+        try:
+            fn(stats)
+        except Exception:
+            logger.exception(f"render hook {fn} failed")
+
+
+class _MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.renders = defaultdict(int)
+        self.attempts = defaultdict(int)
+        self.attempt_seconds = defaultdict(float)
+        self.reruns = defaultdict(int)
+        self.nodes = defaultdict(int)
+        self.response_bytes = defaultdict(int)
+        self.redis_calls = defaultdict(int)
+
+    def __call__(self, stats: RenderStats):
+        with self._lock:
+            self.renders[stats.route, stats.status] += 1
+            self.attempts[stats.route] += len(stats.attempt_seconds)
+            self.attempt_seconds[stats.route] += stats.total_seconds
+            self.reruns[stats.route] += stats.reruns
+            self.nodes[stats.route] += stats.node_count
+            self.response_bytes[stats.route] += stats.response_bytes
+            self.redis_calls[stats.route] += stats.redis_calls
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            lines = []
+            _metric(
+                lines,
+                "gooey_gui_renders_total",
+                "counter",
+                "Number of completed renders.",
+                {_labels(route=r, status=s): v for (r, s), v in self.renders.items()},
+            )
+            _metric(
+                lines,
+                "gooey_gui_render_attempt_seconds",
+                "summary",
+                "Wall time spent per render attempt.",
+                {_labels(route=r): v for r, v in self.attempt_seconds.items()},
+                {_labels(route=r): v for r, v in self.attempts.items()},
+            )
+            for name, help, values in [
+                (
+                    "gooey_gui_render_reruns_total",
+                    "Number of times a render was restarted by a RerunException.",
+                    self.reruns,
+                ),
+                (
+                    "gooey_gui_render_nodes_total",
+                    "Number of render tree nodes sent out.",
+                    self.nodes,
+                ),
+                (
+                    "gooey_gui_response_bytes_total",
+                    "Size of the serialized render responses.",
+                    self.response_bytes,
+                ),
+                (
+                    "gooey_gui_redis_calls_total",
+                    "Number of redis round trips made while rendering.",
+                    self.redis_calls,
+                ),
+            ]:
+                _metric(
+                    lines,
+                    name,
+                    "counter",
+                    help,
+                    {_labels(route=r): v for r, v in values.items()},
+                )
+            return "\n".join(lines) + "\n"
+
+
+def _metric(
+    lines: list[str],
+    name: str,
+    type: str,
+    help: str,
+    values: dict[str, float],
+    counts: dict[str, int] | None = None,
+):
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {type}")
+    if counts is None:
+        for labels, value in values.items():
+            lines.append(f"{name}{{{labels}}} {value}")
+    else:
+        for labels, value in values.items():
+            lines.append(f"{name}_sum{{{labels}}} {value}")
+            lines.append(f"{name}_count{{{labels}}} {counts.get(labels, 0)}")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(
+        '{}="{}"'.format(
+            k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in labels.items()
+    )
+
+
+metrics_registry = add_render_hook(_MetricsRegistry())
+
+
+def prometheus_metrics() -> str:
+    return metrics_registry.prometheus_text()
+
+
+def mount_metrics(app, path: str = "/__/gui/metrics/"):
+    """Serve the render metrics in the Prometheus text format at `path`."""
+    from starlette.responses import PlainTextResponse
+
+    @app.get(path, include_in_schema=False)
+    def gooey_gui_metrics():
+        return PlainTextResponse(
+            prometheus_metrics(), media_type="text/plain; version=0.0.4"
+        )
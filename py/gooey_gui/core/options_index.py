@@ -0,0 +1,203 @@
+import re
+import secrets
+import typing
+import weakref
+
+from decouple import config
+from starlette.responses import Response
+
+from .cache import LRUCache
+from .encoder import dumps
+from .endpoints import expired, router, url_for
+from .keys import hash_values
+
+# max options returned by a single request to the options endpoint
+MAX_OPTIONS_PAGE = config("GUI_MAX_OPTIONS_PAGE", 500, cast=int)
+
+
+class OptionsIndex:
+    """The formatted labels of a list of options, searchable by prefix, substring or subsequence."""
+
+    def __init__(
+        self,
+        options: typing.Sequence,
+        format_func: typing.Callable[[typing.Any], typing.Any],
+    ):
+        self.options = options
+        # weakrefs to the objects that the format func's key refers to by id
+        self.anchors: list[weakref.ref] = []
+        self.labels = [str(format_func(option)) for option in options]
+        self._folded = [label.casefold() for label in self.labels]
+        self.nbytes = sum(len(label) for label in self.labels) * 2
+        # query -> matching positions, so that paging through results doesn't search again
+        self._results: LRUCache[str, list[int]] = LRUCache(maxsize=32)
+
+    def search(self, query: str) -> typing.Sequence[int]:
+        """
+        Returns the positions of the options matching `query`.
+        Labels that start with the query come first, then the ones that contain it,
+        then the ones that contain its characters in order.
+        """
+        query = query.strip().casefold()
+        if not query:
+            return range(len(self.options))
+        results = self._results.get(query)
+        if results is not None:
+            return results
+        pattern = re.compile(".*?".join(map(re.escape, query)))
+        prefix, substring, fuzzy = [], [], []
+        for i, label in enumerate(self._folded):
+            if label.startswith(query):
+                prefix.append(i)
+            elif query in label:
+                substring.append(i)
+            elif pattern.search(label):
+                fuzzy.append(i)
+        results = prefix + substring + fuzzy
+        self._results.set(query, results)
+        return results
+
+    def page(self, query: str, offset: int, limit: int) -> dict[str, typing.Any]:
+        results = self.search(query)
+        return {
+            "total": len(results),
+            "options": [
+                {"value": self.options[i], "label": self.labels[i]}
+                for i in results[offset : offset + limit]
+            ],
+        }
+
+
+_indexes: LRUCache[str, OptionsIndex] = LRUCache(
+    maxsize=config("GUI_OPTIONS_INDEX_MAXSIZE", 256, cast=int),
+    max_bytes=config("GUI_OPTIONS_INDEX_MAX_BYTES", 128 * 1024 * 1024, cast=int),
+    ttl=config("GUI_OPTIONS_INDEX_TTL", 3600, cast=float),
+    sizeof=lambda index: index.nbytes,
+)
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+# e.g. `<object object at 0x7f...>`, which differs between objects that are equal
+_ADDRESS_RE = re.compile(r" at 0x[0-9a-fA-F]+")
+_PLAIN_TYPES = (type(None), bool, int, float, complex, str, bytes)
+
+
+def _value_key(value: typing.Any, anchors: list[weakref.ref]) -> typing.Any:
+    """
+    A key for a value captured by a format func, that's the same on every render.
+    Objects are identified by their id, and a weakref to them is added to `anchors`,
+    so that an object that reuses the id of a dead one isn't mistaken for it.
+    """
+    if isinstance(value, _PLAIN_TYPES):
+        return value
+    if type(value) is tuple:
+        return tuple(_value_key(item, anchors) for item in value)
+    try:
+        anchors.append(weakref.ref(value))
+    except TypeError:
+        # e.g. lists & dicts, which can't be weakly referenced, but are compared by value
+        text = repr(value)
+        if _ADDRESS_RE.search(text):
+            raise _Uncacheable
+        return text
+    return ("id", type(value).__qualname__, id(value))
+
+
+def _format_func_key(fn: typing.Callable) -> tuple[tuple, list[weakref.ref]]:
+    """
+    Returns the key of `fn` and the weakrefs that must still be alive for the key to match.
+    Raises `_Uncacheable` if it can't be identified across renders.
+    """
+    # lambdas & closures are re-created on every render,
+    # so identify them by their code, defaults & captured values instead of their id
+    anchors = []
+    captured = []
+    for cell in getattr(fn, "__closure__", None) or ():
+        try:
+            captured.append(_value_key(cell.cell_contents, anchors))
+        except ValueError:
+            # a variable that wasn't assigned yet
+            captured.append(("empty",))
+    code = getattr(fn, "__code__", None)
+    if code is not None:
+        # e.g. two lambdas in the same function share a qualname
+        code = (
+            code.co_filename,
+            code.co_firstlineno,
+            code.co_code,
+            code.co_consts,
+            code.co_names,
+        )
+    if code is None:
+        # e.g. builtins like `str`
+        name = _value_key(fn, anchors)
+    else:
+        name = getattr(fn, "__qualname__", None)
+    key = (
+        getattr(fn, "__module__", None),
+        name,
+        code,
+        _value_key(getattr(fn, "__defaults__", None), anchors),
+        _value_key(getattr(fn, "__self__", None), anchors),
+        tuple(captured),
+    )
+    return key, anchors
+
+
+def get_options_index(
+    options: typing.Sequence, format_func: typing.Callable[[typing.Any], typing.Any]
+) -> tuple[str, OptionsIndex]:
+    """Returns the (handle, index) for `options`, building the index only if it's not cached."""
+    try:
+        key, anchors = _format_func_key(format_func)
+    except _Uncacheable:
+        # only reachable via its own handle, until it's evicted
+        handle = secrets.token_hex(16)
+        index = OptionsIndex(options, format_func)
+        _indexes.set(handle, index)
+        return handle, index
+    handle = hash_values(options, *key)
+    index = _indexes.get(handle)
+    if index is None or not all(ref() is not None for ref in index.anchors):
+        index = OptionsIndex(options, format_func)
+        index.anchors = anchors
+        _indexes.set(handle, index)
+    return handle, index
+
+
+def searchable_options(
+    options: typing.Sequence,
+    format_func: typing.Callable[[typing.Any], typing.Any],
+    selected: typing.Iterable,
+) -> dict[str, typing.Any] | None:
+    """
+    Props for a select widget that only sends its `selected` options,
+    and lets the client search the rest via the options endpoint.
+
+    Returns `None` if the built-in endpoints are not mounted.
+    """
+    if url_for("/options") is None:
+        return None
+    handle, _ = get_options_index(options, format_func)
+    return dict(
+        optionsUrl=url_for(f"/options/{handle}"),
+        options=[
+            {"value": option, "label": str(format_func(option))} for option in selected
+        ],
+    )
+
+
+@router.get("/options/{handle}")
+def gooey_gui_options(handle: str, q: str = "", offset: int = 0, limit: int = 50):
+    index = _indexes.get(handle)
+    if index is None:
+        raise expired("Options")
+    limit = max(0, min(limit, MAX_OPTIONS_PAGE))
+    return Response(
+        dumps(index.page(q, max(0, offset), limit)),
+        media_type="application/json",
+        headers={"Cache-Control": "private, max-age=60"},
+    )
@@ -1,96 +1,511 @@
+import asyncio
 import hashlib
-import json
+import threading
 import typing
+import weakref
 from contextlib import contextmanager
 from functools import lru_cache
-from time import time
+from time import monotonic
 
+from decouple import config
 from loguru import logger
 
-from .state import threadlocal
+from .cache import LRUCache
+from .codec import get_channel_codec
+from .dispatcher import Subscription
+from .realtime_backend import Updates, get_realtime_backend
+from .state import get_session_state, localctx
 
 T = typing.TypeVar("T")
 
+
+def _optional_int(value: str | None) -> int | None:
+    return int(value) if value else None
+
+
+def _optional_float(value: str | None) -> float | None:
+    return float(value) if value else None
+
+
+# default time window (in seconds) within which `RealtimePublisher` coalesces pushes
+PUBLISH_WINDOW = config("GUI_PUBLISH_WINDOW", 0.1, cast=float)
+
+# max channels remembered per route for `realtime_prefetch()`
+REALTIME_MAX_PREFETCH = config("GUI_REALTIME_MAX_PREFETCH", 100, cast=int)
+# route -> the session state keys that held the channels pulled by its last render.
+# Channels are usually per-session (e.g. `use_state()`), so the next render of the route
+# prefetches the channels under the same keys in *its* session state, not the same channels.
+# Kept in this process instead of the session state, so that clients can't choose what's fetched
+_route_channel_keys: LRUCache[str | None, tuple[str, ...]] = LRUCache(maxsize=1024)
+# the value of stream channels, which points to the stream with their chunks
+STREAM_REF_KEY = "__gui_stream__"
+
 _extra_subscriptions = set()
 
 
+REDIS_URL = config("REDIS_URL", "redis://localhost:6379")
+# per-process connection pool limits, shared by the sync & async clients
+REDIS_MAX_CONNECTIONS = config("GUI_REDIS_MAX_CONNECTIONS", None, cast=_optional_int)
+REDIS_SOCKET_TIMEOUT = config("GUI_REDIS_SOCKET_TIMEOUT", None, cast=_optional_float)
+
+
 @lru_cache
 def get_redis():
     import redis
-    from decouple import config
 
-    return redis.Redis.from_url(config("REDIS_URL", "redis://localhost:6379"))
+    return redis.Redis(connection_pool=_connection_pool(redis))
+
+
+def _connection_pool(module):
+    """
+    A connection pool from `redis` or `redis.asyncio`.
+    With `GUI_REDIS_MAX_CONNECTIONS`, callers wait (up to the socket timeout)
+    for a free connection, instead of failing with "Too many connections".
+    """
+    if REDIS_MAX_CONNECTIONS is None:
+        return module.ConnectionPool.from_url(
+            REDIS_URL, socket_timeout=REDIS_SOCKET_TIMEOUT
+        )
+    kwargs = {}
+    if REDIS_SOCKET_TIMEOUT is not None:
+        kwargs["timeout"] = REDIS_SOCKET_TIMEOUT
+    return module.BlockingConnectionPool.from_url(
+        REDIS_URL,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        **kwargs,
+    )
+
+
+# event loop -> async client, since asyncio connections can't be shared across loops
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, typing.Any]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_redis():
+    """The `redis.asyncio` client for the running event loop, with its own connection pool."""
+    import redis.asyncio
+
+    loop = asyncio.get_running_loop()
+    try:
+        return _async_clients[loop]
+    except KeyError:
+        client = _async_clients[loop] = redis.asyncio.Redis(
+            connection_pool=_connection_pool(redis.asyncio)
+        )
+        return client
 
 
 def realtime_clear_subs():
-    threadlocal.channels = set()
+    localctx.channels = set()
+    localctx.pulled_channels = set()
 
 
 def get_subscriptions() -> set[str]:
     try:
-        channels = threadlocal.channels
+        channels = localctx.channels
     except AttributeError:
-        channels = threadlocal.channels = set()
+        channels = localctx.channels = set()
     for channel in _extra_subscriptions:
         channels.add(f"gooey-gui/state/{channel}")
     return channels
 
 
+def realtime_prefetch():
+    """
+    Fetch the channels that this render is likely to pull with a single `MGET`,
+    so that `realtime_pull()` calls in this pass don't need a round trip.
+
+    That's the channels pulled by earlier passes of this render,
+    and the ones in this session state, under the keys that held the channels pulled
+    by the previous render of this route.
+    Channels that aren't kept in the session state are only prefetched on reruns.
+    """
+    channels = _prefetch_channels()
+    if channels:
+        _mget(localctx.channel_values, channels)
+
+
+async def arealtime_prefetch():
+    """Same as `realtime_prefetch()`, without blocking the event loop."""
+    channels = _prefetch_channels()
+    if channels:
+        results = await get_realtime_backend().amget_versioned(channels)
+        _cache_versioned(localctx.channel_values, channels, results)
+
+
+def _prefetch_channels() -> list[str]:
+    state = get_session_state()
+    channels = set()
+    for key in _route_channel_keys.get(_render_route()) or ():
+        value = state.get(key)
+        if isinstance(value, str):
+            channels.add(f"gooey-gui/state/{value}")
+    try:
+        channels |= localctx.pulled_channels
+    except AttributeError:
+        localctx.pulled_channels = set()
+    localctx.channel_values = {}
+    localctx.channel_versions = {}
+    return list(channels)
+
+
+def realtime_remember_channels():
+    """Remember the channels pulled during this render, for `realtime_prefetch()`."""
+    route = _render_route()
+    pulled = getattr(localctx, "pulled_channels", None)
+    keys = pulled and [
+        key
+        for key, value in get_session_state().items()
+        if isinstance(value, str) and f"gooey-gui/state/{value}" in pulled
+    ]
+    if keys:
+        _route_channel_keys.set(route, tuple(sorted(keys)[:REALTIME_MAX_PREFETCH]))
+    else:
+        _route_channel_keys.pop(route)
+
+
+def _render_route() -> str | None:
+    stats = getattr(localctx, "render_stats", None)
+    return stats and stats.route
+
+
+def get_channel_versions() -> dict[str, int]:
+    """
+    The versions of the subscribed channels that were read during this render,
+    so that clients can skip notifications for versions they've already rendered.
+    """
+    versions = getattr(localctx, "channel_versions", None) or {}
+    return {
+        channel: versions[channel]
+        for channel in get_subscriptions()
+        if channel in versions
+    }
+
+
+def _mget(cache: dict[str, bytes | None], channels: list[str]):
+    _cache_versioned(cache, channels, get_realtime_backend().mget_versioned(channels))
+
+
+def _cache_versioned(
+    cache: dict[str, bytes | None],
+    channels: list[str],
+    results: list[tuple[bytes | None, int | None]],
+):
+    versions = getattr(localctx, "channel_versions", None)
+    for channel, (value, version) in zip(channels, results):
+        cache[channel] = value
+        if versions is not None and version is not None:
+            versions[channel] = version
+
+
 def realtime_pull(channels: list[str]) -> list[typing.Any]:
+    """
+    The current values of `channels`, and subscribe the client to them.
+
+    Channels prefetched by `realtime_prefetch()` don't need a round trip,
+    others are read with a blocking call. On the first pass of a render, only the channels
+    kept in the session state (e.g. by `use_state()`) are prefetched, so `async def` pages,
+    which run on the event loop, should read any others with `await realtime_pull_async()`.
+    """
+    channels, cache = _pull_prepare(channels)
+    missing = [channel for channel in channels if channel not in cache]
+    if missing:
+        _mget(cache, missing)
+    return _resolve_streams(_pull_values(channels, cache))
+
+
+async def realtime_pull_async(channels: list[str]) -> list[typing.Any]:
+    """Same as `realtime_pull()`, without blocking the event loop."""
+    channels, cache = _pull_prepare(channels)
+    missing = [channel for channel in channels if channel not in cache]
+    if missing:
+        results = await get_realtime_backend().amget_versioned(missing)
+        _cache_versioned(cache, missing, results)
+    return await _aresolve_streams(_pull_values(channels, cache))
+
+
+def _pull_prepare(channels: list[str]) -> tuple[list[str], dict[str, bytes | None]]:
     channels = [f"gooey-gui/state/{channel}" for channel in channels]
-    for channel in channels:
-        threadlocal.channels.add(channel)
-    r = get_redis()
-    out = [
-        json.loads(value) if (value := r.get(channel)) else None for channel in channels
-    ]
-    return out
+    get_subscriptions().update(channels)
+    try:
+        # values fetched earlier in this render pass
+        cache = localctx.channel_values
+        localctx.pulled_channels.update(channels)
+    except AttributeError:
+        cache = {}
+    return channels, cache
+
+
+def _pull_values(channels: list[str], cache: dict[str, bytes | None]) -> list:
+    codec = get_channel_codec()
+    return [codec.decode(cache[channel]) for channel in channels]
 
 
 def realtime_push(channel: str, value: typing.Any = "ping", ex=None):
-    from fastapi.encoders import jsonable_encoder
+    _publish({channel: (value, ex)})
+
+
+async def realtime_push_async(channel: str, value: typing.Any = "ping", ex=None):
+    """Same as `realtime_push()`, without blocking the event loop."""
+    await get_realtime_backend().apublish(_encode_updates({channel: (value, ex)}))
+
+
+def _publish(updates: dict[str, tuple[typing.Any, int | None]]):
+    """Set & publish the new values of channels, in a single round trip."""
+    get_realtime_backend().publish(_encode_updates(updates))
 
-    channel = f"gooey-gui/state/{channel}"
-    msg = json.dumps(jsonable_encoder(value))
-    r = get_redis()
-    r.set(channel, msg, ex=ex)
-    t = json.dumps(time())
-    r.publish(channel, t)
-    if isinstance(value, dict):
-        run_status = value.get("__run_status")
-        logger.info(f"publish {t} {channel=} {run_status=}")
-    else:
-        logger.info(f"publish {t} {channel=}")
+
+def _encode_updates(updates: dict[str, tuple[typing.Any, int | None]]) -> Updates:
+    codec = get_channel_codec()
+    ret = {}
+    for channel, (value, ex) in updates.items():
+        channel = f"gooey-gui/state/{channel}"
+        try:
+            # don't serve the old value to a pull later in this render pass
+            localctx.channel_values.pop(channel, None)
+            localctx.channel_versions.pop(channel, None)
+        except AttributeError:
+            pass
+        ret[channel] = (codec.encode(value), ex)
+        if isinstance(value, dict):
+            run_status = value.get("__run_status")
+            logger.debug(f"publish {channel=} {run_status=}")
+        else:
+            logger.debug(f"publish {channel=}")
+    return ret
+
+
+def realtime_append(channel: str, chunk: str, ex=None):
+    """
+    Append `chunk` to the stream `channel`, e.g. for tokens streamed from an LLM.
+
+    `realtime_pull([channel])` returns all the chunks appended so far, joined together.
+    Readers keep the joined value & offset of each stream in this process,
+    so every pull only fetches the chunks appended since the last one.
+    """
+    stream = f"gooey-gui/stream/{channel}"
+    updates = _encode_updates({channel: ({STREAM_REF_KEY: stream}, ex)})
+    get_realtime_backend().append(stream, chunk.encode(), updates)
+
+
+def _is_stream_ref(value: typing.Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and STREAM_REF_KEY in value
+
+
+# stream -> (offset, joined chunks) of the last read
+_streams: LRUCache[str, tuple[typing.Any, str]] = LRUCache(
+    maxsize=config("GUI_STREAM_CACHE_MAXSIZE", 10_000, cast=int),
+    max_bytes=config("GUI_STREAM_CACHE_MAX_BYTES", 64 * 1024 * 1024, cast=int),
+    sizeof=lambda entry: len(entry[1]),
+)
+
+
+def _resolve_streams(values: list[typing.Any]) -> list[typing.Any]:
+    """Replace stream refs in `values` with the joined chunks of their streams."""
+    cached = _cached_streams(values)
+    if not cached:
+        return values
+    offsets = {stream: entry and entry[0] for stream, entry in cached.items()}
+    new_chunks = get_realtime_backend().read_streams(offsets)
+    return _join_streams(values, cached, new_chunks)
+
+
+async def _aresolve_streams(values: list[typing.Any]) -> list[typing.Any]:
+    cached = _cached_streams(values)
+    if not cached:
+        return values
+    offsets = {stream: entry and entry[0] for stream, entry in cached.items()}
+    new_chunks = await get_realtime_backend().aread_streams(offsets)
+    return _join_streams(values, cached, new_chunks)
+
+
+def _cached_streams(values: list[typing.Any]) -> dict[str, tuple | None]:
+    return {
+        value[STREAM_REF_KEY]: _streams.get(value[STREAM_REF_KEY])
+        for value in values
+        if _is_stream_ref(value)
+    }
+
+
+def _join_streams(
+    values: list[typing.Any],
+    cached: dict[str, tuple | None],
+    new_chunks: dict[str, tuple[typing.Any, list[bytes]]],
+) -> list[typing.Any]:
+    joined = {}
+    for stream, entry in cached.items():
+        text = entry[1] if entry else ""
+        if stream in new_chunks:
+            offset, chunks = new_chunks[stream]
+            # chunks are read from the cached offset, so append them to that same entry
+            text += b"".join(chunks).decode()
+            _streams.set(stream, (offset, text))
+        joined[stream] = text
+    return [
+        joined[value[STREAM_REF_KEY]] if _is_stream_ref(value) else value
+        for value in values
+    ]
+
+
+class RealtimePublisher:
+    """
+    For background loops that push faster than clients can rerender, e.g. streamed LLM tokens.
+
+    Pushes to the same channel within `window` seconds are coalesced,
+    so only the latest value is set & published. Intermediate values are dropped,
+    and counted in `dropped`.
+
+        with gui.RealtimePublisher(window=0.2) as publisher:
+            for text in stream:
+                publisher.push(channel, text)
+
+    Appends are coalesced too, but no chunk is ever dropped:
+    the chunks buffered within `window` seconds are appended to the stream as one.
+
+        with gui.RealtimePublisher(window=0.2) as publisher:
+            for token in stream:
+                publisher.append(channel, token)
+    """
+
+    def __init__(self, window: float = PUBLISH_WINDOW):
+        self.window = window
+        self.dropped = 0
+        self._pending: dict[str, tuple[typing.Any, int | None]] = {}
+        self._appends: dict[str, tuple[list[str], int | None]] = {}
+        self._lock = threading.Lock()
+        # held while publishing, so that concurrent flushes publish in the order they took updates
+        self._publish_lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._last_flush = 0.0
+
+    def push(self, channel: str, value: typing.Any = "ping", ex=None):
+        with self._lock:
+            if channel in self._pending:
+                self.dropped += 1
+            self._pending[channel] = (value, ex)
+            if not self._flush_now():
+                return
+        # the first push after a quiet period goes out right away
+        self.flush()
+
+    def append(self, channel: str, chunk: str, ex=None):
+        """Same as `realtime_append()`, but coalesced with the other chunks in the window."""
+        with self._lock:
+            chunks = self._appends.get(channel, ([], None))[0]
+            chunks.append(chunk)
+            self._appends[channel] = (chunks, ex)
+            if not self._flush_now():
+                return
+        self.flush()
+
+    def _flush_now(self) -> bool:
+        """
+        Returns `True` if the window has passed, and pending updates should be published right away.
+        Otherwise, schedules a flush for the end of the window. Must be called with `_lock` held.
+        """
+        if self._timer is not None:
+            return False
+        delay = self._last_flush + self.window - monotonic()
+        if delay <= 0:
+            return True
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+        return False
+
+    def flush(self):
+        """Publish the pending values & chunks now."""
+        with self._publish_lock:
+            with self._lock:
+                if self._timer:
+                    self._timer.cancel()
+                    self._timer = None
+                updates, self._pending = self._pending, {}
+                appends, self._appends = self._appends, {}
+                self._last_flush = monotonic()
+            if updates:
+                _publish(updates)
+            for channel, (chunks, ex) in appends.items():
+                realtime_append(channel, "".join(chunks), ex)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self) -> "RealtimePublisher":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 @contextmanager
 def realtime_subscribe(channel: str) -> typing.Generator:
     channel = f"gooey-gui/state/{channel}"
-    r = get_redis()
-    pubsub = r.pubsub()
-    pubsub.subscribe(channel)
     logger.info(f"subscribe {channel=}")
     try:
-        yield _realtime_sub_gen(channel, pubsub)
+        with get_realtime_backend().subscribe([channel]) as sub:
+            yield _realtime_sub_gen(channel, sub)
     finally:
         logger.info(f"unsubscribe {channel=}")
-        pubsub.unsubscribe(channel)
-        pubsub.close()
 
 
-def _realtime_sub_gen(channel: str, pubsub: "redis.client.PubSub") -> typing.Generator:
-    while True:
-        message = pubsub.get_message(timeout=10)
-        if not (message and message["type"] == "message"):
-            continue
-        r = get_redis()
-        value = json.loads(r.get(channel))
-        if isinstance(value, dict):
-            run_status = value.get("__run_status")
-            logger.info(f"realtime_subscribe: {channel=} {run_status=}")
-        else:
-            logger.info(f"realtime_subscribe: {channel=}")
-        yield value
+def _realtime_sub_gen(channel: str, sub: "Subscription") -> typing.Generator:
+    for _, message in sub:
+        value = _log_published_value(channel, _get_published_value(channel, message))
+        yield _resolve_streams([value])[0]
+
+
+async def realtime_subscribe_async(channel: str) -> typing.AsyncGenerator:
+    """
+    Async version of `realtime_subscribe()`, yields the new values of `channel`:
+
+        async for value in gui.realtime_subscribe_async(channel):
+            ...
+    """
+    channel = f"gooey-gui/state/{channel}"
+    logger.info(f"subscribe {channel=}")
+    try:
+        async with get_realtime_backend().subscribe([channel]) as sub:
+            async for _, message in sub:
+                entry = _published_entry(channel, message)
+                if entry is None:
+                    entry = (message, await get_realtime_backend().aget(channel))
+                    _published_values.set(channel, entry)
+                value = _log_published_value(channel, entry[1])
+                yield (await _aresolve_streams([value]))[0]
+    finally:
+        logger.info(f"unsubscribe {channel=}")
+
+
+# channel -> (message, value) of the last publish, shared by all the subscribers in this process
+_published_values: LRUCache[str, tuple[bytes, bytes | None]] = LRUCache(maxsize=1024)
+
+
+def _published_entry(channel: str, message: bytes) -> tuple[bytes, bytes | None] | None:
+    entry = _published_values.get(channel)
+    if entry and entry[0] == message:
+        return entry
+    return None
+
+
+def _get_published_value(channel: str, message: bytes) -> bytes | None:
+    entry = _published_entry(channel, message)
+    if entry is None:
+        entry = (message, get_realtime_backend().get(channel))
+        _published_values.set(channel, entry)
+    return entry[1]
+
+
+def _log_published_value(channel: str, value: bytes | None) -> typing.Any:
+    value = get_channel_codec().decode(value)
+    if isinstance(value, dict):
+        run_status = value.get("__run_status")
+        logger.info(f"realtime_subscribe: {channel=} {run_status=}")
+    else:
+        logger.info(f"realtime_subscribe: {channel=}")
+    return value
 
 
 def md5_values(*values) -> str:
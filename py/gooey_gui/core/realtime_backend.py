@@ -0,0 +1,372 @@
+import hashlib
+import threading
+import typing
+from time import monotonic
+
+from decouple import config
+
+from .dispatcher import LocalDispatcher, RealtimeDispatcher, Subscription
+from .metrics import count_redis_calls
+
+# channel -> (encoded value, expiry in seconds)
+Updates = dict[str, tuple[bytes, int | None]]
+T = typing.TypeVar("T")
+
+# versions outlive the values of channels, so that a channel that's set again after
+# its value expired doesn't restart from a version that clients have already rendered
+VERSION_TTL = config("GUI_CHANNEL_VERSION_TTL", 24 * 60 * 60, cast=int)
+
+
+def version_key(channel: str) -> str:
+    # must match versionKey() in realtime.tsx
+    return "gooey-gui/version/" + channel.removeprefix("gooey-gui/state/")
+
+
+def _version_ttl(ex: int | None) -> int | None:
+    return ex and max(ex, VERSION_TTL)
+
+
+class RealtimeBackend:
+    """
+    Stores the latest value of each realtime channel,
+    and notifies subscribers of the channels whenever they're set.
+
+    Every publish increments the version of the channel,
+    which is what subscribers receive as the message.
+    """
+
+    dispatcher: LocalDispatcher
+
+    def mget(self, channels: list[str]) -> list[bytes | None]:
+        raise NotImplementedError
+
+    def get(self, channel: str) -> bytes | None:
+        return self.mget([channel])[0]
+
+    def mget_versioned(
+        self, channels: list[str]
+    ) -> list[tuple[bytes | None, int | None]]:
+        """Like `mget()`, along with the current version of each channel."""
+        raise NotImplementedError
+
+    def publish(self, updates: Updates):
+        """Set the values of channels (with optional expiry), and notify their subscribers."""
+        raise NotImplementedError
+
+    def append(self, stream: str, chunk: bytes, updates: Updates):
+        """
+        Append `chunk` to `stream`, along with `publish(updates)`.
+        `updates` point channels at the stream, and set its expiry.
+        """
+        raise NotImplementedError
+
+    def read_streams(
+        self, offsets: dict[str, typing.Any]
+    ) -> dict[str, tuple[typing.Any, list[bytes]]]:
+        """
+        Read the chunks of each stream after its offset (`None` to read from the start).
+        Returns `stream -> (new offset, chunks)`, for the streams that have new chunks.
+        """
+        raise NotImplementedError
+
+    async def amget(self, channels: list[str]) -> list[bytes | None]:
+        return self.mget(channels)
+
+    async def aget(self, channel: str) -> bytes | None:
+        return (await self.amget([channel]))[0]
+
+    async def amget_versioned(
+        self, channels: list[str]
+    ) -> list[tuple[bytes | None, int | None]]:
+        return self.mget_versioned(channels)
+
+    async def apublish(self, updates: Updates):
+        self.publish(updates)
+
+    async def aread_streams(
+        self, offsets: dict[str, typing.Any]
+    ) -> dict[str, tuple[typing.Any, list[bytes]]]:
+        return self.read_streams(offsets)
+
+    def subscribe(self, channels: typing.Iterable[str]) -> Subscription:
+        return self.dispatcher.subscribe(channels)
+
+
+class RedisRealtimeBackend(RealtimeBackend):
+    def __init__(self):
+        self.dispatcher = RealtimeDispatcher()
+
+    def mget(self, channels: list[str]) -> list[bytes | None]:
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        return get_redis().mget(channels)
+
+    def mget_versioned(
+        self, channels: list[str]
+    ) -> list[tuple[bytes | None, int | None]]:
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        keys = channels + [version_key(channel) for channel in channels]
+        return _zip_versions(get_redis().mget(keys))
+
+    def publish(self, updates: Updates):
+        from .pubsub import get_redis
+
+        _run_publish_script(get_redis(), *_publish_script_args(updates))
+
+    async def amget(self, channels: list[str]) -> list[bytes | None]:
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        return await get_async_redis().mget(channels)
+
+    async def amget_versioned(
+        self, channels: list[str]
+    ) -> list[tuple[bytes | None, int | None]]:
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        keys = channels + [version_key(channel) for channel in channels]
+        return _zip_versions(await get_async_redis().mget(keys))
+
+    async def apublish(self, updates: Updates):
+        from .pubsub import get_async_redis
+
+        await _arun_publish_script(get_async_redis(), *_publish_script_args(updates))
+
+    def append(self, stream: str, chunk: bytes, updates: Updates):
+        from .pubsub import get_redis
+
+        ex = max((ex for _, ex in updates.values() if ex), default=None)
+        _run_publish_script(
+            get_redis(), *_publish_script_args(updates, stream, chunk, ex)
+        )
+
+    def read_streams(
+        self, offsets: dict[str, typing.Any]
+    ) -> dict[str, tuple[typing.Any, list[bytes]]]:
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        return self._parse_xread(get_redis().xread(self._xread_args(offsets)))
+
+    async def aread_streams(
+        self, offsets: dict[str, typing.Any]
+    ) -> dict[str, tuple[typing.Any, list[bytes]]]:
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        ret = await get_async_redis().xread(self._xread_args(offsets))
+        return self._parse_xread(ret)
+
+    @staticmethod
+    def _xread_args(offsets: dict[str, typing.Any]) -> dict[str, typing.Any]:
+        # offsets are the id of the last entry read, xread returns the ones after it
+        return {stream: offset or "0" for stream, offset in offsets.items()}
+
+    @staticmethod
+    def _parse_xread(ret) -> dict[str, tuple[typing.Any, list[bytes]]]:
+        streams = {}
+        for stream, entries in ret or ():
+            if isinstance(stream, bytes):
+                stream = stream.decode()
+            if entries:
+                streams[stream] = (
+                    entries[-1][0],
+                    [fields[b"c"] for _, fields in entries],
+                )
+        return streams
+
+
+def _zip_versions(ret: list) -> list[tuple[bytes | None, int | None]]:
+    n = len(ret) // 2
+    return [
+        (value, int(version) if version is not None else None)
+        for value, version in zip(ret[:n], ret[n:])
+    ]
+
+
+def _publish_script_args(
+    updates: Updates, stream: str = "", chunk: bytes = b"", ex: int | None = None
+) -> tuple[list, list]:
+    keys, args = [stream], [chunk, ex or 0]
+    for channel, (value, channel_ex) in updates.items():
+        keys += [channel, version_key(channel)]
+        args += [value, channel_ex or 0, _version_ttl(channel_ex) or 0]
+    return keys, args
+
+
+def _run_publish_script(client, keys: list, args: list):
+    """
+    Append, set, bump the version & publish it for all channels, in a single round trip.
+    The script is atomic by itself, so it's not wrapped in a MULTI.
+    """
+    from redis.exceptions import NoScriptError
+
+    count_redis_calls()
+    try:
+        return client.evalsha(PUBLISH_SCRIPT_SHA, len(keys), *keys, *args)
+    except NoScriptError:
+        # e.g. the first call after a redis restart, which also caches the script
+        count_redis_calls()
+        return client.eval(PUBLISH_SCRIPT, len(keys), *keys, *args)
+
+
+async def _arun_publish_script(client, keys: list, args: list):
+    from redis.exceptions import NoScriptError
+
+    count_redis_calls()
+    try:
+        return await client.evalsha(PUBLISH_SCRIPT_SHA, len(keys), *keys, *args)
+    except NoScriptError:
+        count_redis_calls()
+        return await client.eval(PUBLISH_SCRIPT, len(keys), *keys, *args)
+
+
+# KEYS: the stream to append to (or "" for none), then (channel, version key) pairs
+# ARGV: the chunk & expiry of the stream, then (value, expiry, version expiry) triples
+PUBLISH_SCRIPT = """
+local stream = KEYS[1]
+if stream ~= "" then
+    redis.call("XADD", stream, "*", "c", ARGV[1])
+    local stream_ex = tonumber(ARGV[2])
+    if stream_ex > 0 then
+        redis.call("EXPIRE", stream, stream_ex)
+    end
+end
+for i = 1, (#KEYS - 1) / 2 do
+    local channel, version_key = KEYS[i * 2], KEYS[i * 2 + 1]
+    local value = ARGV[i * 3]
+    local ex, version_ex = tonumber(ARGV[i * 3 + 1]), tonumber(ARGV[i * 3 + 2])
+    if ex > 0 then
+        redis.call("SET", channel, value, "EX", ex)
+    else
+        redis.call("SET", channel, value)
+    end
+    local version = redis.call("INCR", version_key)
+    if version_ex > 0 then
+        redis.call("EXPIRE", version_key, version_ex)
+    else
+        redis.call("PERSIST", version_key)
+    end
+    redis.call("PUBLISH", channel, version)
+end
+"""
+PUBLISH_SCRIPT_SHA = hashlib.sha1(PUBLISH_SCRIPT.encode()).hexdigest()
+
+
+class MemoryRealtimeBackend(RealtimeBackend):
+    """
+    Keeps channels in this process, for single-node deployments and tests.
+
+    Reads don't take any locks, so pulls in the same process as the pushes cost microseconds.
+    Expired values are dropped lazily when read, and swept every `sweep_interval` publishes.
+    """
+
+    def __init__(self, sweep_interval: int = 1000):
+        self.dispatcher = LocalDispatcher()
+        # channel -> (value, monotonic expiry time)
+        self._values: dict[str, tuple[bytes, float | None]] = {}
+        # channel -> (version, monotonic expiry time)
+        self._versions: dict[str, tuple[int, float | None]] = {}
+        # stream -> (chunks, monotonic expiry time). Offsets are the number of chunks read
+        self._streams: dict[str, tuple[list[bytes], float | None]] = {}
+        self._lock = threading.Lock()
+        self._sweep_interval = sweep_interval
+        self._publishes = 0
+
+    def mget(self, channels: list[str]) -> list[bytes | None]:
+        now = monotonic()
+        return [_unexpired(self._values.get(channel), now) for channel in channels]
+
+    def mget_versioned(
+        self, channels: list[str]
+    ) -> list[tuple[bytes | None, int | None]]:
+        now = monotonic()
+        return [
+            (
+                _unexpired(self._values.get(channel), now),
+                _unexpired(self._versions.get(channel), now),
+            )
+            for channel in channels
+        ]
+
+    def publish(self, updates: Updates):
+        now = monotonic()
+        messages = {}
+        with self._lock:
+            for channel, (value, ex) in updates.items():
+                self._values[channel] = (value, ex and now + ex)
+                version = (_unexpired(self._versions.get(channel), now) or 0) + 1
+                version_ex = _version_ttl(ex)
+                self._versions[channel] = (version, version_ex and now + version_ex)
+                messages[channel] = str(version).encode()
+            self._publishes += 1
+            if self._publishes % self._sweep_interval == 0:
+                self._sweep(now)
+        for channel, message in messages.items():
+            self.dispatcher.fan_out(channel, message)
+
+    def append(self, stream: str, chunk: bytes, updates: Updates):
+        ex = max((ex for _, ex in updates.values() if ex), default=None)
+        expiry = ex and monotonic() + ex
+        with self._lock:
+            chunks = self._streams.get(stream, ([], None))[0]
+            chunks.append(chunk)
+            self._streams[stream] = (chunks, expiry)
+        self.publish(updates)
+
+    def read_streams(
+        self, offsets: dict[str, typing.Any]
+    ) -> dict[str, tuple[typing.Any, list[bytes]]]:
+        now = monotonic()
+        ret = {}
+        for stream, offset in offsets.items():
+            entry = self._streams.get(stream)
+            if entry is None or (entry[1] is not None and entry[1] <= now):
+                continue
+            offset = offset or 0
+            # copy, since the list may be appended to concurrently
+            chunks = entry[0][offset:]
+            if chunks:
+                ret[stream] = (offset + len(chunks), chunks)
+        return ret
+
+    def _sweep(self, now: float):
+        for entries in (self._values, self._versions, self._streams):
+            expired = [
+                key
+                for key, (_, expiry) in entries.items()
+                if expiry is not None and expiry <= now
+            ]
+            for key in expired:
+                entries.pop(key, None)
+
+
+def _unexpired(entry: tuple[T, float | None] | None, now: float) -> T | None:
+    if entry is None or (entry[1] is not None and entry[1] <= now):
+        return None
+    return entry[0]
+
+
+_realtime_backend: RealtimeBackend | None = None
+
+
+def get_realtime_backend() -> RealtimeBackend:
+    global _realtime_backend
+    if _realtime_backend is None:
+        match config("GUI_REALTIME_BACKEND", "redis"):
+            case "redis":
+                _realtime_backend = RedisRealtimeBackend()
+            case "memory":
+                _realtime_backend = MemoryRealtimeBackend()
+            case other:
+                raise ValueError(f"Unknown GUI_REALTIME_BACKEND={other!r}")
+    return _realtime_backend
+
+
+def set_realtime_backend(backend: RealtimeBackend):
+    global _realtime_backend
+    _realtime_backend = backend
@@ -0,0 +1,91 @@
+import typing
+from time import time
+
+from decouple import config
+from fastapi import Query
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from .encoder import dumps
+from .endpoints import router
+from .realtime_backend import get_realtime_backend
+
+# seconds between comments sent on idle connections, so that proxies don't close them
+REALTIME_HEARTBEAT = config("GUI_REALTIME_HEARTBEAT", 15, cast=float)
+REALTIME_MAX_CHANNELS = config("GUI_REALTIME_MAX_CHANNELS", 100, cast=int)
+
+
+@router.get("/realtime")
+async def gooey_gui_realtime(request: Request, channels: list[str] = Query([])):
+    return realtime_sse_response(request, channels)
+
+
+def realtime_sse_response(request: Request, channels: list[str]) -> Response:
+    """
+    A server-sent events stream that notifies the client whenever any of `channels` are set,
+    e.g. the `channels` from `get_subscriptions()` that are sent with every render.
+
+    All connections in this process share the realtime backend's dispatcher,
+    so there's one redis connection per process, not one per browser tab.
+    Slow clients only get the latest version of each channel.
+    """
+    # only the state channels, so that clients can't listen to arbitrary redis channels
+    channels = [
+        channel for channel in channels if channel.startswith("gooey-gui/state/")
+    ][:REALTIME_MAX_CHANNELS]
+    if not channels:
+        return Response(status_code=204)
+    return StreamingResponse(
+        _event_stream(request, channels),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _event_stream(
+    request: Request, channels: list[str]
+) -> typing.AsyncIterator[bytes]:
+    backend = get_realtime_backend()
+    async with backend.subscribe(channels) as sub:
+        yield b"retry: 1000\n\n"
+        # for channels set while we were connecting, the client skips the versions it has
+        results = await backend.amget_versioned(channels)
+        # channels without a value (e.g. an unset `use_state()`) have nothing to render
+        versions = {
+            channel: version
+            for channel, (value, version) in zip(channels, results)
+            if value is not None
+        }
+        if versions:
+            yield _event(versions)
+        while not await request.is_disconnected():
+            item = await sub.aget(timeout=REALTIME_HEARTBEAT)
+            if item is None:
+                if sub.closed:
+                    break
+                yield b": heartbeat\n\n"
+                continue
+            # send everything that's pending as a single event
+            versions = {}
+            while item:
+                channel, message = item
+                versions[channel] = _parse_version(message)
+                item = sub.get(timeout=0)
+            if None in versions.values():
+                # the client can't tell if it has rendered this, so it always rerenders
+                versions = None
+            yield _event(versions)
+
+
+def _parse_version(message: bytes) -> int | None:
+    try:
+        return int(message)
+    except ValueError:
+        # e.g. a timestamp published by an older version
+        return None
+
+
+def _event(versions: dict[str, int] | None) -> bytes:
+    # same format as the events sent by `realtime.tsx`
+    data = dumps({"versions": versions, "t": int(time() * 1000)})
+    return b"data: " + data + b"\n\n"
@@ -1,44 +1,62 @@
 import inspect
 import typing
+from dataclasses import dataclass, field
 from functools import partial, wraps
 
 from fastapi import Depends
-from fastapi.encoders import jsonable_encoder
+from loguru import logger
 from starlette.requests import Request
-from starlette.responses import JSONResponse, RedirectResponse, Response
+from starlette.responses import RedirectResponse, Response
 
-from .exceptions import RedirectException, RerunException, StopException
+from .blob_store import aload_state, aoffload_state, load_state, offload_state
+from .encoder import dumps, dumps_object
+from .endpoints import url_for
+from .exceptions import (
+    RedirectException,
+    RerunException,
+    RerunLimitExceeded,
+    StopException,
+)
+from .metrics import MAX_RERUNS, RenderStats, report_render, start_render_stats
 from .pubsub import (
+    get_channel_versions,
     get_subscriptions,
     realtime_clear_subs,
+    arealtime_prefetch,
+    realtime_prefetch,
+    realtime_remember_channels,
 )
-from .state import get_session_state, set_session_state, set_query_params, threadlocal
+from .session_store import ServerSessionState
+from .state import get_session_state, set_session_state, set_query_params, localctx
+from .styles import astylesheet_href, stylesheet_href
+from .tree_diff import tree_payload
 
 Style = dict[str, str | None]
 ReactHTMLProps = dict[str, typing.Any]
 
 
 def current_root_ctx() -> "NestingCtx":
-    return threadlocal.root_ctx
+    return localctx.root_ctx
 
 
 def add_styles(className: str, css: str):
-    threadlocal.styles[className] = css
+    localctx.styles[className] = css
 
 
+@dataclass(slots=True, eq=False)
 class RenderTreeNode:
-    def __init__(
-        self,
-        name: str,
-        props: ReactHTMLProps | None = None,
-        children: list["RenderTreeNode"] | None = None,
-    ):
-        self.name = name
-        self.props = props or {}
-        self.children = children or []
+    name: str
+    props: ReactHTMLProps = field(default_factory=dict)
+    children: list["RenderTreeNode"] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.props is None:
+            self.props = {}
+        if self.children is None:
+            self.children = []
 
     def mount(self) -> "RenderTreeNode":
-        threadlocal.render_root.children.append(self)
+        localctx.render_root.children.append(self)
         return self
 
     def to_dict(self) -> dict:
@@ -51,18 +69,18 @@ class RenderTreeNode:
 
 class NestingCtx:
     def __init__(self, node: RenderTreeNode | None = None):
-        self.node = node or threadlocal.render_root
+        self.node = node or localctx.render_root
         self.parent = None
 
     def __enter__(self):
         try:
-            self.parent = threadlocal.render_root
+            self.parent = localctx.render_root
         except AttributeError:
             pass
-        threadlocal.render_root = self.node
+        localctx.render_root = self.node
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        threadlocal.render_root = self.parent
+        localctx.render_root = self.parent
 
     def empty(self):
         """Empty the children of the node"""
@@ -75,20 +93,48 @@ async def request_json(request: Request) -> dict | None:
         return await request.json()
 
 
-def route(app, *paths, **kwargs):
+def route(app, *paths, server_state: bool = False, **kwargs):
+    """
+    Register `fn` as a gooey-gui page on the given paths.
+
+    `fn` can be a regular function, which is run in FastAPI's threadpool,
+    or an `async def` function, which is awaited on the event loop.
+
+    With `server_state=True`, the session state is kept in the server-side session store.
+    The client only exchanges a `state_token` with the server (see `renderer()`),
+    and gets back the values of the widgets on the page, i.e. the state keys named by a `name` prop.
+    """
+
     def decorator(fn):
-        @wraps(fn)
-        def wrapper(request: Request, json_data: dict | None, **kwargs):
+        def renderer_kwargs(request: Request, json_data: dict | None, kwargs: dict):
             if "request" in fn_sig.parameters:
                 kwargs["request"] = request
             if "json_data" in fn_sig.parameters:
                 kwargs["json_data"] = json_data
-            return renderer(
-                partial(fn, **kwargs),
+            return dict(
+                render=partial(fn, **kwargs),
                 query_params=dict(request.query_params),
                 state=json_data and json_data.get("state"),
+                tree_version=json_data and json_data.get("tree_version"),
+                route=getattr(request.scope.get("route"), "path", None),
+                server_state=server_state,
+                state_token=json_data and json_data.get("state_token"),
             )
 
+        if inspect.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def wrapper(request: Request, json_data: dict | None, **kwargs):
+                return await async_renderer(
+                    **renderer_kwargs(request, json_data, kwargs)
+                )
+
+        else:
+
+            @wraps(fn)
+            def wrapper(request: Request, json_data: dict | None, **kwargs):
+                return renderer(**renderer_kwargs(request, json_data, kwargs))
+
         fn_sig = inspect.signature(fn)
         mod_params = dict(fn_sig.parameters) | dict(
             request=inspect.Parameter(
@@ -119,43 +165,223 @@ def renderer(
     render: typing.Callable,
     state: dict[str, typing.Any] = None,
     query_params: dict[str, str] = None,
+    tree_version: str | None = None,
+    route: str | None = None,
+    server_state: bool = False,
+    state_token: str | None = None,
 ) -> dict | Response:
-    set_session_state(state or {})
-    set_query_params(query_params or {})
-    realtime_clear_subs()
-    threadlocal.use_state_count = 0
-    threadlocal.styles = {}
-    while True:
-        try:
-            root = RenderTreeNode(name="root")
-            threadlocal.root_ctx = NestingCtx(root)
-            with threadlocal.root_ctx:
-                styles_node = RenderTreeNode(
-                    name="tag",
-                    props=dict(__reactjsxelement="style"),
-                ).mount()
-                try:
+    server_session = ServerSessionState(state_token) if server_state else None
+    stats = _init_render(
+        load_state(_incoming_state(state, server_session)),
+        query_params,
+        route or _route_name(render),
+        server_session,
+    )
+    try:
+        while True:
+            root = _init_render_root(stats)
+            realtime_prefetch()
+            try:
+                with localctx.root_ctx, stats.attempt():
                     ret = render()
-                except StopException:
-                    ret = None
-                except RedirectException as e:
-                    return RedirectResponse(e.url, status_code=e.status_code)
-                if threadlocal.styles:
-                    styles_node.props["dangerouslySetInnerHTML"] = {
-                        "__html": "\n".join(threadlocal.styles.values())
-                    }
+            except RerunException:
+                continue
+            except StopException:
+                ret = None
+            except RedirectException as e:
+                stats.status = "redirect"
+                return RedirectResponse(e.url, status_code=e.status_code)
             if isinstance(ret, Response):
+                stats.status = "ok"
                 return ret
-            return JSONResponse(
-                jsonable_encoder(
-                    dict(
-                        children=root.to_dict()["children"],
-                        state=get_session_state(),
-                        channels=get_subscriptions(),
-                        **(ret or {}),
-                    )
-                ),
-                headers={"X-GOOEY-GUI-ROUTE": "1"},
+            return _render_response(
+                root,
+                ret,
+                tree_version,
+                stats,
+                _state_body(root),
+                stylesheet_href(localctx.styles),
             )
-        except RerunException:
-            continue
+    finally:
+        report_render(stats)
+
+
+async def async_renderer(
+    render: typing.Callable[..., typing.Awaitable],
+    state: dict[str, typing.Any] = None,
+    query_params: dict[str, str] = None,
+    tree_version: str | None = None,
+    route: str | None = None,
+    server_state: bool = False,
+    state_token: str | None = None,
+) -> dict | Response:
+    """
+    Same as `renderer()`, but for `async def` render functions.
+    The session state, its blobs, the stylesheet, and prefetched channels are read & written
+    without blocking the event loop. Channels that weren't prefetched are still read
+    with a blocking call by `realtime_pull()`, see its docs.
+    """
+    server_session = (
+        await ServerSessionState.aload(state_token) if server_state else None
+    )
+    stats = _init_render(
+        await aload_state(_incoming_state(state, server_session)),
+        query_params,
+        route or _route_name(render),
+        server_session,
+    )
+    try:
+        while True:
+            root = _init_render_root(stats)
+            await arealtime_prefetch()
+            try:
+                with localctx.root_ctx, stats.attempt():
+                    ret = await render()
+            except RerunException:
+                continue
+            except StopException:
+                ret = None
+            except RedirectException as e:
+                stats.status = "redirect"
+                return RedirectResponse(e.url, status_code=e.status_code)
+            if isinstance(ret, Response):
+                stats.status = "ok"
+                return ret
+            return _render_response(
+                root,
+                ret,
+                tree_version,
+                stats,
+                await _astate_body(root),
+                await astylesheet_href(localctx.styles),
+            )
+    finally:
+        report_render(stats)
+
+
+def _route_name(render: typing.Callable) -> str:
+    fn = render.func if isinstance(render, partial) else render
+    return getattr(fn, "__qualname__", None) or repr(fn)
+
+
+def _incoming_state(
+    state: dict | None, server_session: ServerSessionState | None
+) -> dict:
+    if server_session:
+        # the client only sends the values that changed since the last render
+        return server_session.state | (state or {})
+    return state or {}
+
+
+def _init_render(
+    state: dict,
+    query_params: dict | None,
+    route: str,
+    server_session: ServerSessionState | None = None,
+) -> RenderStats:
+    localctx.reset()
+    localctx.server_session = server_session
+    set_session_state(state)
+    set_query_params(query_params or {})
+    realtime_clear_subs()
+    localctx.use_state_count = 0
+    localctx.styles = {}
+    return start_render_stats(route)
+
+
+def _init_render_root(stats: RenderStats) -> RenderTreeNode:
+    if MAX_RERUNS and stats.reruns >= MAX_RERUNS:
+        stats.status = "rerun_limit"
+        logger.error(f"render loop limit reached {stats.route=} {stats.reruns=}")
+        raise RerunLimitExceeded(stats.route, stats.reruns)
+    localctx.callsite_counts = {}
+    root = RenderTreeNode(name="root")
+    localctx.root_ctx = NestingCtx(root)
+    with localctx.root_ctx:
+        localctx.styles_node = RenderTreeNode(
+            name="tag",
+            props=dict(__reactjsxelement="style"),
+        ).mount()
+    return root
+
+
+def _state_body(root: RenderTreeNode) -> dict[str, typing.Any]:
+    state = get_session_state()
+    if localctx.server_session:
+        return dict(
+            state_token=localctx.server_session.save(state),
+            state=_widget_state(root, state),
+        )
+    return dict(state=offload_state(state))
+
+
+async def _astate_body(root: RenderTreeNode) -> dict[str, typing.Any]:
+    state = get_session_state()
+    if localctx.server_session:
+        return dict(
+            state_token=await localctx.server_session.asave(state),
+            state=_widget_state(root, state),
+        )
+    return dict(state=await aoffload_state(state))
+
+
+def _widget_state(root: RenderTreeNode, state: dict) -> dict[str, typing.Any]:
+    """
+    The values of the widgets rendered in `root`, which the client needs to display them.
+    The rest of the session state stays on the server.
+    """
+    names = set()
+    _collect_names(root, names)
+    return {name: state[name] for name in names if name in state}
+
+
+def _collect_names(node: RenderTreeNode, names: set[str]):
+    name = node.props.get("name")
+    if isinstance(name, str):
+        names.add(name)
+    for child in node.children:
+        _collect_names(child, names)
+
+
+def _render_response(
+    root: RenderTreeNode,
+    ret: typing.Any,
+    tree_version: str | None,
+    stats: RenderStats,
+    body: dict[str, typing.Any],
+    styles_href: str | None,
+) -> Response:
+    stats.status = "ok"
+    if localctx.styles:
+        _render_styles(localctx.styles_node, localctx.styles, styles_href)
+    realtime_remember_channels()
+    body |= dict(
+        channels=get_subscriptions(),
+        channel_versions=get_channel_versions(),
+        **(ret or {}),
+    )
+    realtime_url = url_for("/realtime")
+    if realtime_url:
+        # stream realtime events from python, instead of the remix server
+        body["realtime_url"] = realtime_url
+    tree = tree_payload(root.children, tree_version)
+    content = dumps_object(body, **tree)
+    stats.node_count = _count_nodes(root) - 1
+    stats.response_bytes = len(content)
+    return Response(
+        content,
+        media_type="application/json",
+        headers={"X-GOOEY-GUI-ROUTE": "1"},
+    )
+
+
+def _render_styles(node: RenderTreeNode, styles: dict[str, str], href: str | None):
+    if href:
+        # link to the (long-cached) stylesheet instead of inlining the css
+        node.props.update(__reactjsxelement="link", rel="stylesheet", href=href)
+    else:
+        node.props["dangerouslySetInnerHTML"] = {"__html": "\n".join(styles.values())}
+
+
+def _count_nodes(node: RenderTreeNode) -> int:
+    return 1 + sum(_count_nodes(child) for child in node.children)
@@ -0,0 +1,234 @@
+import hashlib
+import hmac
+import secrets
+import typing
+import uuid
+from functools import lru_cache
+
+from decouple import config
+from loguru import logger
+
+from .cache import LRUCache
+from .encoder import dumps, loads
+from .metrics import count_redis_calls
+
+SESSION_TTL = config("GUI_SESSION_TTL", 24 * 60 * 60, cast=int)
+# superseded versions are kept around this long, for requests that are still in flight
+SESSION_SUPERSEDED_TTL = config("GUI_SESSION_SUPERSEDED_TTL", 60, cast=int)
+
+
+class SessionStore:
+    """Stores encoded session states by session id & version."""
+
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ex: int):
+        raise NotImplementedError
+
+    def expire(self, key: str, ex: int):
+        """Shorten the remaining lifetime of `key` to `ex` seconds."""
+        value = self.get(key)
+        if value is not None:
+            self.set(key, value, ex)
+
+    async def aget(self, key: str) -> bytes | None:
+        return self.get(key)
+
+    async def aset(self, key: str, value: bytes, ex: int):
+        self.set(key, value, ex)
+
+    async def aexpire(self, key: str, ex: int):
+        self.expire(key, ex)
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(
+        self,
+        maxsize: int = config("GUI_SESSION_STORE_MAXSIZE", 10_000, cast=int),
+        max_bytes: int = config(
+            "GUI_SESSION_STORE_MAX_BYTES", 256 * 1024 * 1024, cast=int
+        ),
+    ):
+        self._cache: LRUCache[str, bytes] = LRUCache(
+            maxsize=maxsize, max_bytes=max_bytes, sizeof=len
+        )
+
+    def get(self, key: str) -> bytes | None:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: bytes, ex: int):
+        self._cache.set(key, value, ttl=ex)
+
+
+class RedisSessionStore(SessionStore):
+    def get(self, key: str) -> bytes | None:
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        return get_redis().get(f"gooey-gui/session/{key}")
+
+    def set(self, key: str, value: bytes, ex: int):
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        get_redis().set(f"gooey-gui/session/{key}", value, ex=ex)
+
+    def expire(self, key: str, ex: int):
+        from .pubsub import get_redis
+
+        count_redis_calls()
+        get_redis().expire(f"gooey-gui/session/{key}", ex)
+
+    async def aget(self, key: str) -> bytes | None:
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        return await get_async_redis().get(f"gooey-gui/session/{key}")
+
+    async def aset(self, key: str, value: bytes, ex: int):
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        await get_async_redis().set(f"gooey-gui/session/{key}", value, ex=ex)
+
+    async def aexpire(self, key: str, ex: int):
+        from .pubsub import get_async_redis
+
+        count_redis_calls()
+        await get_async_redis().expire(f"gooey-gui/session/{key}", ex)
+
+
+_session_store: SessionStore | None = None
+
+
+def get_session_store() -> SessionStore:
+    global _session_store
+    if _session_store is None:
+        match config("GUI_SESSION_STORE", "memory"):
+            case "redis":
+                _session_store = RedisSessionStore()
+            case "memory":
+                _session_store = MemorySessionStore()
+            case other:
+                raise ValueError(f"Unknown GUI_SESSION_STORE={other!r}")
+    return _session_store
+
+
+def set_session_store(store: SessionStore):
+    global _session_store
+    _session_store = store
+
+
+@lru_cache
+def _secret_key() -> bytes:
+    secret = config("GUI_SECRET_KEY", "")
+    if not secret:
+        logger.warning(
+            "GUI_SECRET_KEY is not set, "
+            "session state tokens will only be valid for this process"
+        )
+        secret = secrets.token_hex(32)
+    return secret.encode()
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(_secret_key(), payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def make_state_token(session_id: str, version: str) -> str:
+    payload = f"{session_id}.{version}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def parse_state_token(token: str | None) -> tuple[str, str] | None:
+    """Returns the (session_id, version) from a token, or `None` if it's invalid."""
+    if not token:
+        return None
+    try:
+        session_id, version, signature = token.split(".")
+    except ValueError:
+        return None
+    if not hmac.compare_digest(_sign(f"{session_id}.{version}"), signature):
+        return None
+    return session_id, version
+
+
+class ServerSessionState:
+    """
+    Tracks a session state that's kept on the server between requests.
+
+    Clients only send the `state_token` from the last response along with changed values,
+    and get back a new token along with the values of the rendered widgets, instead of the full state.
+    """
+
+    def __init__(self, token: str | None):
+        parsed = parse_state_token(token)
+        self._load(parsed, parsed and get_session_store().get("/".join(parsed)))
+
+    @classmethod
+    async def aload(cls, token: str | None) -> "ServerSessionState":
+        """Same as `ServerSessionState(token)`, without blocking the event loop."""
+        self = cls.__new__(cls)
+        parsed = parse_state_token(token)
+        self._load(parsed, parsed and await get_session_store().aget("/".join(parsed)))
+        return self
+
+    def _load(self, parsed: tuple[str, str] | None, data: bytes | None):
+        self.session_id = None
+        self.version = None
+        self.digest = None
+        self.state = {}
+        if parsed:
+            if data is not None:
+                self.session_id, self.version = parsed
+                self.digest = hashlib.md5(data).digest()
+                self.state = loads(data)
+            else:
+                logger.warning(
+                    f"session state expired or evicted, starting over {parsed=}"
+                )
+        if not self.session_id:
+            self.session_id = uuid.uuid4().hex
+
+    def save(self, state: dict[str, typing.Any]) -> str:
+        """Persist the state, and return the token for it."""
+        data = dumps(state)
+        superseded = self.version
+        if self._next_version(data):
+            store = get_session_store()
+            store.set(f"{self.session_id}/{self.version}", data, ex=SESSION_TTL)
+            if superseded:
+                # only the latest version of a session needs to live for the full ttl
+                store.expire(f"{self.session_id}/{superseded}", SESSION_SUPERSEDED_TTL)
+        return make_state_token(self.session_id, self.version)
+
+    async def asave(self, state: dict[str, typing.Any]) -> str:
+        """Same as `save()`, without blocking the event loop."""
+        data = dumps(state)
+        superseded = self.version
+        if self._next_version(data):
+            store = get_session_store()
+            await store.aset(f"{self.session_id}/{self.version}", data, ex=SESSION_TTL)
+            if superseded:
+                await store.aexpire(
+                    f"{self.session_id}/{superseded}", SESSION_SUPERSEDED_TTL
+                )
+        return make_state_token(self.session_id, self.version)
+
+    def _next_version(self, data: bytes) -> bool:
+        """
+        Moves on to a new version for `data`.
+        Returns `False` if nothing changed, so the client's current token is still good.
+        """
+        digest = hashlib.md5(data).digest()
+        if self.version and digest == self.digest:
+            return False
+        try:
+            counter = int(self.version.split("-")[0]) + 1
+        except (AttributeError, ValueError):
+            counter = 1
+        # the random suffix prevents concurrent requests from overwriting each other
+        self.version = f"{counter}-{secrets.token_hex(3)}"
+        self.digest = digest
+        return True
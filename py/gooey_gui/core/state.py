@@ -1,29 +1,63 @@
-import threading
 import typing
+from contextvars import ContextVar
+from types import SimpleNamespace
 
 
-threadlocal = threading.local()
+class ContextLocal:
+    """
+    Like `threading.local()`, but backed by a `ContextVar`,
+    so each request sees its own attributes, whether it runs in a worker thread or an asyncio task.
+    """
+
+    def __init__(self, name: str):
+        object.__setattr__(self, "_var", ContextVar(name))
+
+    def reset(self):
+        """Start with a fresh set of attributes in the current context."""
+        self._var.set(SimpleNamespace())
+
+    def _namespace(self) -> SimpleNamespace:
+        try:
+            return self._var.get()
+        except LookupError:
+            ns = SimpleNamespace()
+            self._var.set(ns)
+            return ns
+
+    def __getattr__(self, name: str) -> typing.Any:
+        return getattr(self._namespace(), name)
+
+    def __setattr__(self, name: str, value: typing.Any):
+        setattr(self._namespace(), name, value)
+
+    def __delattr__(self, name: str):
+        delattr(self._namespace(), name)
+
+
+localctx = ContextLocal("gooey_gui")
+# backwards compatibility
+threadlocal = localctx
 
 
 def get_session_state() -> dict[str, typing.Any]:
     try:
-        return threadlocal.session_state
+        return localctx.session_state
     except AttributeError:
-        threadlocal.session_state = {}
-        return threadlocal.session_state
+        localctx.session_state = {}
+        return localctx.session_state
 
 
 def set_session_state(state: dict[str, typing.Any]):
-    threadlocal.session_state = state
+    localctx.session_state = state
 
 
 def get_query_params() -> dict[str, str]:
     try:
-        return threadlocal.query_params
+        return localctx.query_params
     except AttributeError:
-        threadlocal.query_params = {}
-        return threadlocal.query_params
+        localctx.query_params = {}
+        return localctx.query_params
 
 
 def set_query_params(params: dict[str, str]):
-    threadlocal.query_params = params
+    localctx.query_params = params
@@ -6,7 +6,7 @@ from functools import wraps
 
 import gooey_gui.components as gui
 from .pubsub import realtime_pull, realtime_push
-from .state import threadlocal, get_session_state
+from .state import localctx, get_session_state
 
 F = typing.TypeVar("F", bound=typing.Callable[..., typing.Any])
 
@@ -102,8 +102,8 @@ def run_in_thread(
 
 def use_state(initval, *, key: str | None = None, ex=60):
     if key is None:
-        threadlocal.use_state_count += 1
-        key = f"{use_state.__name__}/{threadlocal.use_state_count}"
+        localctx.use_state_count += 1
+        key = f"{use_state.__name__}/{localctx.use_state_count}"
 
     session_state = get_session_state()
     channel = session_state.setdefault(key, f"{use_state.__name__}/{uuid.uuid1()}")
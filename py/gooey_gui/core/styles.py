@@ -0,0 +1,119 @@
+import hashlib
+import textwrap
+from functools import lru_cache
+
+from decouple import config
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .blob_store import (
+    BlobStore,
+    LocalDiskBlobStore,
+    RedisBlobStore,
+    is_valid_digest,
+)
+from .cache import LRUCache
+from .endpoints import router, url_for
+
+# how long the local cache trusts that a stylesheet is still in the styles store
+STYLES_STORED_TTL = config("GUI_STYLES_STORED_TTL", 60 * 60, cast=int)
+
+_styles_store: BlobStore | None = None
+_styles_store_loaded = False
+
+# digests of the stylesheets this process has already put in the styles store
+_stored: LRUCache[str, bool] = LRUCache(maxsize=4096, ttl=STYLES_STORED_TTL)
+
+
+@lru_cache(maxsize=4096)
+def compile_styles(css: str) -> tuple[str, str]:
+    """
+    Compile a `styled()` rule, replacing `&` with a unique class name.
+    Returns the (className, css) tuple.
+    """
+    css = textwrap.dedent(css).strip()
+    className = "gui-" + hashlib.md5(css.encode()).hexdigest()
+    css = css.replace("&", "." + className)
+    return className, css
+
+
+def get_styles_store() -> BlobStore | None:
+    """
+    The store that page stylesheets are served from.
+    None if styles should be inlined into every response (the default),
+    since the store must be shared by every server process that can serve the stylesheet url.
+    """
+    global _styles_store, _styles_store_loaded
+    if not _styles_store_loaded:
+        match config("GUI_STYLES_STORE", "inline"):
+            case "redis":
+                _styles_store = RedisBlobStore(
+                    ex=config("GUI_STYLES_TTL", 24 * 60 * 60, cast=int)
+                )
+            case "disk":
+                _styles_store = LocalDiskBlobStore(
+                    config("GUI_STYLES_DIR", ".gooey-gui/styles"),
+                    max_bytes=config(
+                        "GUI_STYLES_DISK_MAX_BYTES", 256 * 1024 * 1024, cast=int
+                    ),
+                )
+            case "inline":
+                _styles_store = None
+            case other:
+                raise ValueError(f"Unknown GUI_STYLES_STORE={other!r}")
+        _styles_store_loaded = True
+    return _styles_store
+
+
+def set_styles_store(store: BlobStore | None):
+    global _styles_store, _styles_store_loaded
+    _styles_store = store
+    _styles_store_loaded = True
+    _stored.clear()
+
+
+def stylesheet_href(styles: dict[str, str]) -> str | None:
+    """
+    Returns a (long-cached) url for a stylesheet with the rules in `styles`,
+    or None if they should be inlined, i.e. no styles store is configured, or gui isn't mounted.
+    """
+    store, digest, href = _stylesheet(styles)
+    if href and digest not in _stored:
+        store.put(digest, "\n".join(styles.values()).encode())
+        _stored.set(digest, True)
+    return href
+
+
+async def astylesheet_href(styles: dict[str, str]) -> str | None:
+    """Same as `stylesheet_href()`, without blocking the event loop."""
+    store, digest, href = _stylesheet(styles)
+    if href and digest not in _stored:
+        await store.aput(digest, "\n".join(styles.values()).encode())
+        _stored.set(digest, True)
+    return href
+
+
+def _stylesheet(styles: dict[str, str]) -> tuple[BlobStore | None, str, str | None]:
+    store = get_styles_store()
+    if store is None or not styles:
+        return store, "", None
+    # class names are already hashes of the rules
+    digest = hashlib.md5("\n".join(styles).encode()).hexdigest()
+    return store, digest, url_for(f"/styles/{digest}.css")
+
+
+@router.get("/styles/{digest}.css")
+def gooey_gui_stylesheet(request: Request, digest: str):
+    store = get_styles_store()
+    data = store and is_valid_digest(digest) and store.get(digest)
+    if not data:
+        raise HTTPException(status_code=404)
+    # the digest is derived from the contents, so the url never changes meaning
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(data, media_type="text/css", headers=headers)
@@ -0,0 +1,365 @@
+import csv
+import io
+import json
+import sys
+import threading
+import typing
+
+from decouple import config
+from fastapi import HTTPException
+from furl import furl
+from loguru import logger
+from starlette.responses import Response
+
+from .cache import LRUCache
+from .encoder import dumps
+from .endpoints import expired, router, url_for
+from .keys import hash_values
+from .thumbnails import Fetcher, url_fetcher
+
+# tables with fewer rows than this are inlined in the render tree
+TABLE_INLINE_ROWS = config("GUI_TABLE_INLINE_ROWS", 1000, cast=int)
+TABLE_FETCH_TIMEOUT = config("GUI_TABLE_FETCH_TIMEOUT", 60, cast=float)
+TABLE_FETCH_MAX_BYTES = config(
+    "GUI_TABLE_FETCH_MAX_BYTES", 100 * 1024 * 1024, cast=int
+)
+# max rows returned by a single request to the tables endpoint
+MAX_TABLE_PAGE = config("GUI_MAX_TABLE_PAGE", 1000, cast=int)
+
+_CSV_EXTENSIONS = {".csv": ",", ".tsv": "\t"}
+_XLSX_EXTENSIONS = {".xlsx", ".xlsm"}
+
+
+class Table:
+    """
+    A table stored column by column, that can be sorted, filtered
+    and sliced into windows of rows without copying the cells.
+
+    Cells are plain values, or `{"value": ...}` dicts with extra props (e.g. from `data_table()`).
+    `nbytes` estimates the memory used by the cells, along with the text & sort key columns
+    that are built lazily for filtering & sorting, so that the tables cache's byte bound holds.
+    """
+
+    def __init__(self, header: list[str], rows: typing.Iterable[typing.Sequence]):
+        self.columns = header
+        self.data: list[list] = [[] for _ in header]
+        self.nbytes = 0
+        num_rows = 0
+        for row in rows:
+            for j, col in enumerate(self.data):
+                cell = row[j] if j < len(row) else None
+                col.append(cell)
+                self.nbytes += _cell_nbytes(cell)
+            num_rows += 1
+        self.num_rows = num_rows
+        # lazily computed per column
+        self._text: dict[int, list[str]] = {}
+        self._sort_keys: dict[int, list[tuple]] = {}
+        # (sort, filters) -> row order
+        self._orders: LRUCache[str, typing.Sequence[int]] = LRUCache(maxsize=16)
+        self._lock = threading.Lock()
+
+    def window(
+        self,
+        offset: int,
+        limit: int,
+        sort: list[dict] | None = None,
+        filters: dict[str, dict] | None = None,
+    ) -> dict[str, typing.Any]:
+        order = self.order(sort or [], filters or {})
+        return {
+            "columns": self.columns,
+            "total": len(order),
+            "rows": [
+                [col[i] for col in self.data] for i in order[offset : offset + limit]
+            ],
+        }
+
+    def order(self, sort: list[dict], filters: dict[str, dict]) -> typing.Sequence[int]:
+        """
+        The indices of the rows that pass `filters`, sorted by `sort`.
+        Both use the same shape as ag-grid's `sortModel` and `filterModel`.
+        """
+        if not sort and not filters:
+            return range(self.num_rows)
+        cache_key = json.dumps([sort, filters], sort_keys=True)
+        order = self._orders.get(cache_key)
+        if order is not None:
+            return order
+        order = range(self.num_rows)
+        for col_id, model in filters.items():
+            j = self._col_index(col_id)
+            if j is None:
+                continue
+            text = self._column_text(j)
+            order = [i for i in order if _matches(model, text[i])]
+        # sort by the least significant column first, relying on sort stability
+        for item in reversed(sort):
+            j = self._col_index(item.get("colId"))
+            if j is None:
+                continue
+            keys = self._column_sort_keys(j)
+            order = sorted(
+                order, key=keys.__getitem__, reverse=item.get("sort") == "desc"
+            )
+        self._orders.set(cache_key, order)
+        return order
+
+    def _col_index(self, col_id: str | None) -> int | None:
+        try:
+            return self.columns.index(col_id)
+        except ValueError:
+            return None
+
+    def _column_text(self, j: int) -> list[str]:
+        with self._lock:
+            if j not in self._text:
+                self._text[j] = [
+                    str(_cell_value(cell) or "").casefold() for cell in self.data[j]
+                ]
+            return self._text[j]
+
+    def _column_sort_keys(self, j: int) -> list[tuple]:
+        with self._lock:
+            if j not in self._sort_keys:
+                self._sort_keys[j] = [_sort_key(cell) for cell in self.data[j]]
+            return self._sort_keys[j]
+
+
+def _cell_value(cell: typing.Any) -> typing.Any:
+    if isinstance(cell, dict):
+        return cell.get("value")
+    return cell
+
+
+# a list slot, and a sort key tuple with its number (or a str, counted like the text)
+_SORT_KEY_BYTES = 8 + sys.getsizeof((0, 0.0, "")) + sys.getsizeof(0.0)
+
+
+def _cell_nbytes(cell: typing.Any) -> int:
+    value = _cell_value(cell)
+    size = 8 + sys.getsizeof(value)
+    if isinstance(cell, dict):
+        size += sys.getsizeof(cell)
+    # the cell itself, its casefolded text, and its sort key
+    return size * 2 + _SORT_KEY_BYTES
+
+
+def _sort_key(cell: typing.Any) -> tuple:
+    value = _cell_value(cell)
+    if value is None or value == "":
+        # blanks go last
+        return (2, 0, "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, value, "")
+    try:
+        return (0, float(str(value).replace(",", "")), "")
+    except ValueError:
+        return (1, 0, str(value).casefold())
+
+
+def _matches(model: dict, text: str) -> bool:
+    conditions = model.get("conditions")
+    if conditions:
+        results = (_matches(condition, text) for condition in conditions)
+        if model.get("operator") == "OR":
+            return any(results)
+        return all(results)
+    query = str(model.get("filter") or "").casefold()
+    match model.get("type"):
+        case "contains":
+            return query in text
+        case "notContains":
+            return query not in text
+        case "equals":
+            return text == query
+        case "notEqual":
+            return text != query
+        case "startsWith":
+            return text.startswith(query)
+        case "endsWith":
+            return text.endswith(query)
+        case "blank":
+            return not text
+        case "notBlank":
+            return bool(text)
+        case _:
+            return True
+
+
+def table_from_cells(cells: list[list]) -> Table:
+    header = [str(_cell_value(cell) or "") for cell in cells[0]]
+    return Table(header, cells[1:])
+
+
+def set_table_fetcher(fetcher: Fetcher):
+    """
+    Set the function used to download table files, e.g. to read `/static/...` urls
+    from a local directory, or `url_fetcher(allow_private_hosts=True)` for internal hosts.
+    """
+    global _fetcher
+    _fetcher = fetcher
+
+
+def table_from_url(url: str) -> Table:
+    """Download & parse a csv, tsv or xlsx file. The first row is used as the header."""
+    ext = _file_ext(url)
+    data = io.BytesIO(_fetcher(url))
+    if ext in _CSV_EXTENSIONS:
+        text = io.TextIOWrapper(data, encoding="utf-8-sig", newline="")
+        return _table_from_rows(csv.reader(text, delimiter=_CSV_EXTENSIONS[ext]))
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(data, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        return _table_from_rows(
+            ["" if value is None else str(value) for value in row] for row in rows
+        )
+    finally:
+        workbook.close()
+
+
+def _table_from_rows(rows: typing.Iterator[list[str]]) -> Table:
+    header = next(rows, [])
+    skip_first_col = bool(header) and not header[0]
+    if skip_first_col:
+        # e.g. a dataframe exported with its index
+        header = header[1:]
+    columns = [
+        j
+        for j, name in enumerate(header)
+        if name and not name.startswith("__EMPTY")
+    ]
+    start = 1 if skip_first_col else 0
+    return Table(
+        [header[j] for j in columns],
+        (
+            [row[j + start] if j + start < len(row) else "" for j in columns]
+            for row in rows
+            if any(row)
+        ),
+    )
+
+
+def _file_ext(url: str) -> str:
+    path = str(furl(url).path).lower()
+    return path[path.rfind(".") :] if "." in path else ""
+
+
+def can_serve_url(url: str) -> bool:
+    if furl(url).scheme not in ("http", "https"):
+        return False
+    ext = _file_ext(url)
+    if ext in _CSV_EXTENSIONS:
+        return True
+    if ext in _XLSX_EXTENSIONS:
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            return False
+        return True
+    return False
+
+
+def _source_nbytes(source: str | list) -> int:
+    if isinstance(source, str):
+        return len(source)
+    # estimated from a sample of rows, since the whole list may be huge
+    sample = source[:: max(len(source) // 100, 1)]
+    return len(repr(sample)) * len(source) // max(len(sample), 1)
+
+
+# handle -> the file url or cells that a table is loaded from
+_sources: LRUCache[str, str | list] = LRUCache(
+    maxsize=config("GUI_TABLE_SOURCES_MAXSIZE", 1024, cast=int),
+    max_bytes=config("GUI_TABLE_SOURCES_MAX_BYTES", 256 * 1024 * 1024, cast=int),
+    sizeof=_source_nbytes,
+)
+_tables: LRUCache[str, Table] = LRUCache(
+    maxsize=config("GUI_TABLE_CACHE_MAXSIZE", 64, cast=int),
+    max_bytes=config("GUI_TABLE_CACHE_MAX_BYTES", 1024 * 1024 * 1024, cast=int),
+    ttl=config("GUI_TABLE_CACHE_TTL", 3600, cast=float),
+    sizeof=lambda table: table.nbytes,
+)
+_load_locks: dict[str, threading.Lock] = {}
+# the urls come from page content, so only public http(s) hosts by default
+_fetcher: Fetcher = url_fetcher(
+    max_bytes=TABLE_FETCH_MAX_BYTES, timeout=TABLE_FETCH_TIMEOUT
+)
+_load_locks_lock = threading.Lock()
+
+
+def register_table(source: str | list, key: str | None = None) -> str | None:
+    """
+    Register a file url or list of cells to be served in windows by the tables endpoint,
+    and return the endpoint's url. The table is only parsed when a window is first requested.
+
+    Cell lists are identified by a hash of their contents, unless a `key` is given,
+    which must change whenever the cells do.
+
+    Returns `None` if the table should be sent inline instead,
+    i.e. the endpoints aren't mounted, the file type isn't supported, or the table is small.
+    """
+    if url_for("/tables") is None:
+        return None
+    if isinstance(source, str):
+        if not can_serve_url(source):
+            return None
+    elif len(source) <= TABLE_INLINE_ROWS:
+        return None
+    if key is not None and not isinstance(source, str):
+        handle = hash_values("table-key", key, len(source))
+    else:
+        handle = hash_values("table", source)
+    if _sources.get(handle) is None:
+        _sources.set(handle, source)
+    return url_for(f"/tables/{handle}")
+
+
+def get_table(handle: str) -> Table | None:
+    table = _tables.get(handle)
+    if table is not None:
+        return table
+    with _load_locks_lock:
+        lock = _load_locks.setdefault(handle, threading.Lock())
+    # make concurrent requests for the same table wait for a single download
+    with lock:
+        table = _tables.get(handle)
+        if table is not None:
+            return table
+        source = _sources.get(handle)
+        if source is None:
+            return None
+        if isinstance(source, str):
+            logger.info(f"loading table {source=}")
+            table = table_from_url(source)
+        else:
+            table = table_from_cells(source)
+        _tables.set(handle, table)
+    with _load_locks_lock:
+        _load_locks.pop(handle, None)
+    return table
+
+
+@router.get("/tables/{handle}")
+def gooey_gui_table(
+    handle: str,
+    offset: int = 0,
+    limit: int = 100,
+    sort: str = "[]",
+    filter: str = "{}",
+):
+    try:
+        sort_model = json.loads(sort)
+        filter_model = json.loads(filter)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sort or filter")
+    table = get_table(handle)
+    if table is None:
+        raise expired("Table")
+    limit = max(0, min(limit, MAX_TABLE_PAGE))
+    return Response(
+        dumps(table.window(max(0, offset), limit, sort_model, filter_model)),
+        media_type="application/json",
+    )
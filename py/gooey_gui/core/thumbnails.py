@@ -0,0 +1,254 @@
+import hashlib
+import ipaddress
+import socket
+import threading
+import typing
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import time
+from urllib.parse import unquote
+
+from decouple import Csv, config
+from fastapi import HTTPException
+from furl import furl
+from loguru import logger
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .blob_store import BlobStore, LocalDiskBlobStore, is_valid_digest
+from .cache import LRUCache
+from .encoder import dumps, loads
+from .endpoints import router, url_for
+from .images import _MEDIA_TYPES, IMAGE_FORMAT, IMAGE_QUALITY, _encode_cv2_img
+
+# the widths that thumbnails are generated at, if the source image is wider
+THUMBNAIL_WIDTHS = config("GUI_THUMBNAIL_WIDTHS", "320,640,1280", cast=Csv(int))
+THUMBNAIL_FETCH_TIMEOUT = config("GUI_THUMBNAIL_FETCH_TIMEOUT", 30, cast=float)
+THUMBNAIL_FETCH_MAX_BYTES = config(
+    "GUI_THUMBNAIL_FETCH_MAX_BYTES", 50 * 1024 * 1024, cast=int
+)
+
+Fetcher = typing.Callable[[str], bytes]
+
+
+def url_fetcher(
+    *,
+    allow_file_urls: bool = False,
+    allow_private_hosts: bool = False,
+    max_bytes: int = THUMBNAIL_FETCH_MAX_BYTES,
+    timeout: float = THUMBNAIL_FETCH_TIMEOUT,
+) -> Fetcher:
+    """
+    Returns a fetcher that downloads `http(s)://` urls from public hosts,
+    refusing responses larger than `max_bytes`.
+
+    Since the urls come from page content, reading `file://` urls from disk
+    and downloading from private hosts (e.g. `localhost` or internal services) are opt-in:
+    `set_image_fetcher(url_fetcher(allow_file_urls=True))`
+    """
+
+    def check_url(url: str):
+        f = furl(url)
+        if f.scheme not in ("http", "https"):
+            raise ValueError(f"Can't fetch {url=}")
+        if not allow_private_hosts and not _is_public_host(f.host):
+            raise ValueError(f"Refusing to fetch from a private host {url=}")
+
+    class RedirectHandler(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, req, fp, code, msg, headers, newurl):
+            check_url(newurl)
+            return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+    opener = urllib.request.build_opener(RedirectHandler)
+
+    def fetch(url: str) -> bytes:
+        f = furl(url)
+        if f.scheme == "file" and allow_file_urls:
+            return Path(unquote(str(f.path))).read_bytes()
+        check_url(url)
+        with opener.open(url, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            raise ValueError(f"Response too large {url=}")
+        return data
+
+    return fetch
+
+
+def _is_public_host(host: str | None) -> bool:
+    if not host:
+        return False
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    # every address the host resolves to must be public
+    return all(
+        ipaddress.ip_address(info[4][0].split("%")[0]).is_global for info in infos
+    )
+
+
+default_fetcher = url_fetcher()
+_fetcher: Fetcher = default_fetcher
+_thumbnail_store: BlobStore | None = None
+_executor = ThreadPoolExecutor(
+    max_workers=config("GUI_THUMBNAIL_WORKERS", 4, cast=int),
+    thread_name_prefix="gooey-gui-thumbnails",
+)
+# how long the thumbnails of a url are used before its image is fetched again,
+# so that changes to the image are picked up
+THUMBNAIL_MANIFEST_TTL = config("GUI_THUMBNAIL_MANIFEST_TTL", 600, cast=int)
+# url -> [(width, digest), ...] of the thumbnails that are ready.
+# The original image has no digest. Expires so that evicted thumbnails are noticed
+_manifests: LRUCache[str, list[tuple[int, str | None]]] = LRUCache(
+    maxsize=10_000, ttl=THUMBNAIL_MANIFEST_TTL
+)
+# don't retry failed urls on every render
+_failed: LRUCache[str, bool] = LRUCache(maxsize=10_000, ttl=300)
+_pending: set[str] = set()
+_pending_lock = threading.Lock()
+
+
+def set_image_fetcher(fetcher: Fetcher):
+    """
+    Set the function used to read the source images of thumbnails,
+    e.g. to read `/static/...` urls from a local directory,
+    or `url_fetcher(allow_file_urls=True)` to allow `file://` urls.
+    """
+    global _fetcher
+    _fetcher = fetcher
+
+
+def get_thumbnail_store() -> BlobStore:
+    global _thumbnail_store
+    if _thumbnail_store is None:
+        _thumbnail_store = LocalDiskBlobStore(
+            config("GUI_THUMBNAIL_DIR", ".gooey-gui/thumbnails"),
+            max_bytes=config(
+                "GUI_THUMBNAIL_DISK_MAX_BYTES", 2 * 1024 * 1024 * 1024, cast=int
+            ),
+        )
+    return _thumbnail_store
+
+
+def set_thumbnail_store(store: BlobStore):
+    global _thumbnail_store
+    _thumbnail_store = store
+
+
+def image_srcset(url: str) -> str | None:
+    """
+    Returns a `srcset` with thumbnails of the image at `url`,
+    or `None` if they aren't ready yet (or the endpoints aren't mounted).
+
+    Thumbnails are generated in the background the first time a url is seen,
+    so the first render of an image only uses its original `src`.
+    """
+    if url_for("/thumbnails") is None:
+        return None
+    manifest = _get_manifest(url)
+    if manifest is None:
+        if not _failed.get(url):
+            _schedule(url)
+        return None
+    candidates = []
+    for width, digest in manifest:
+        src = url_for(f"/thumbnails/{digest}.{IMAGE_FORMAT}") if digest else url
+        candidates.append(f"{src} {width}w")
+    return ", ".join(candidates)
+
+
+def _manifest_digest(url: str) -> str:
+    # stores never overwrite a digest, so a new one is used every ttl,
+    # after which the image is fetched again, in case it has changed
+    period = int(time() // THUMBNAIL_MANIFEST_TTL)
+    return hashlib.sha256(f"manifest:{url}:{period}".encode()).hexdigest()
+
+
+def _thumbnail_digest(data: bytes, width: int) -> str:
+    # derived from the image itself, since thumbnail urls are cached forever
+    key = f"{hashlib.sha256(data).hexdigest()}:{width}:{IMAGE_FORMAT}:{IMAGE_QUALITY}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _get_manifest(url: str) -> list[tuple[int, str | None]] | None:
+    manifest = _manifests.get(url)
+    if manifest is not None:
+        return manifest
+    # e.g. generated by another process, or before a restart
+    store = get_thumbnail_store()
+    data = store.get(_manifest_digest(url))
+    if data is None:
+        return None
+    manifest = [tuple(entry) for entry in loads(data)]
+    if not all(store.exists(digest) for _, digest in manifest if digest):
+        # some thumbnails were evicted
+        return None
+    _manifests.set(url, manifest)
+    return manifest
+
+
+def _schedule(url: str):
+    with _pending_lock:
+        if url in _pending:
+            return
+        _pending.add(url)
+    _executor.submit(_generate, url)
+
+
+def _generate(url: str):
+    try:
+        manifest = generate_thumbnails(url)
+    except Exception as e:
+        logger.warning(f"failed to generate thumbnails {url=} {e!r}")
+        _failed.set(url, True)
+    else:
+        _manifests.set(url, manifest)
+    finally:
+        with _pending_lock:
+            _pending.discard(url)
+
+
+def generate_thumbnails(url: str) -> list[tuple[int, str | None]]:
+    """Fetch the image at `url` and store its thumbnails. Returns the manifest."""
+    import cv2
+    import numpy as np
+
+    data = _fetcher(url)
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img is None:
+        raise ValueError("Unsupported image format")
+    h, w = img.shape[:2]
+    store = get_thumbnail_store()
+    manifest = []
+    for width in sorted(THUMBNAIL_WIDTHS):
+        if width >= w:
+            break
+        digest = _thumbnail_digest(data, width)
+        if not store.exists(digest):
+            height = max(1, round(h * width / w))
+            resized = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+            store.put(digest, _encode_cv2_img(resized, IMAGE_FORMAT, None))
+        manifest.append((width, digest))
+    # the original is the largest candidate
+    manifest.append((w, None))
+    store.put(_manifest_digest(url), dumps(manifest))
+    return manifest
+
+
+@router.get("/thumbnails/{digest}.{ext}")
+def gooey_gui_thumbnail(request: Request, digest: str, ext: str):
+    media_type = _MEDIA_TYPES.get(ext)
+    if not media_type or not is_valid_digest(digest):
+        raise HTTPException(status_code=404)
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    data = get_thumbnail_store().get(digest)
+    if data is None:
+        raise HTTPException(status_code=404)
+    return Response(data, media_type=media_type, headers=headers)
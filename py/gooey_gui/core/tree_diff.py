@@ -0,0 +1,163 @@
+import hashlib
+import typing
+from functools import lru_cache
+
+from decouple import config
+
+from .cache import LRUCache
+from .encoder import dumps, loads
+
+if typing.TYPE_CHECKING:
+    from .renderer import RenderTreeNode
+
+TreePath = list[int]
+Patch = dict[str, typing.Any]
+
+
+class _Shape(typing.NamedTuple):
+    """
+    What we remember of a node that was sent out: just enough to diff against,
+    i.e. its encoded props, and a hash of the whole encoded node.
+    """
+
+    name: str
+    props: bytes
+    children: tuple["_Shape", ...]
+    digest: int
+
+
+# rough per-node overhead of a `_Shape` in memory, for the cache's byte limit
+_SHAPE_NODE_BYTES = 200
+
+# the shapes of the last trees sent out, keyed by their fingerprint (aka version)
+_sent_trees: LRUCache[str, tuple[tuple[_Shape, ...], int]] = LRUCache(
+    maxsize=config("GUI_TREE_CACHE_SIZE", 1000, cast=int),
+    max_bytes=config("GUI_TREE_CACHE_MAX_BYTES", 64 * 1024 * 1024, cast=int),
+    sizeof=lambda entry: entry[1],
+)
+
+
+def tree_payload(
+    children: list["RenderTreeNode"], client_version: str | None = None
+) -> dict[str, bytes]:
+    """
+    Returns the render tree to send to the client.
+
+    If the client already has a tree we remember (identified by `client_version`),
+    only a list of patches to go from that tree to `children` is sent.
+    Otherwise, e.g. on first load or a version mismatch, the full tree is sent.
+
+    The props of each node are encoded once, and both the full tree and the shape
+    that's remembered for the next diff are built from them,
+    so diffing never needs to re-encode or parse the trees.
+    All the returned values are encoded JSON, ready to be spliced into the response.
+    """
+    parts = [b"["]
+    shapes, _, count = _encode_children(children, parts)
+    parts.append(b"]")
+    data = b"".join(parts)
+    version = hashlib.md5(data).hexdigest()
+    old = _sent_trees.get(client_version) if client_version else None
+    if version not in _sent_trees:
+        _sent_trees.set(version, (shapes, len(data) + count * _SHAPE_NODE_BYTES))
+    if client_version == version:
+        patches = b"[]"
+    elif old:
+        patches = dumps(diff_trees(old[0], shapes))
+    else:
+        patches = None
+    # a diff that's larger than the tree itself is not worth it
+    if patches is not None and len(patches) < len(data):
+        return dict(
+            tree_version=dumps(version),
+            base_tree_version=dumps(client_version),
+            patches=patches,
+        )
+    return dict(tree_version=dumps(version), children=data)
+
+
+def diff_trees(
+    old: typing.Sequence[_Shape], new: typing.Sequence[_Shape], path: TreePath = None
+) -> list[Patch]:
+    """
+    Compute the patches needed to turn the children list `old` into `new`.
+
+    Paths are lists of child indices, starting from the root's children.
+    Patches must be applied in order, since removals shift the indices of later siblings.
+    """
+    path = path or []
+    patches = []
+    common = min(len(old), len(new))
+    for i in range(common):
+        patches.extend(_diff_node(old[i], new[i], path + [i]))
+    for i in range(common, len(new)):
+        patches.append(dict(op="insert", path=path + [i], node=_to_json(new[i])))
+    for i in reversed(range(common, len(old))):
+        patches.append(dict(op="remove", path=path + [i]))
+    return patches
+
+
+def _diff_node(old: _Shape, new: _Shape, path: TreePath) -> list[Patch]:
+    if old.digest == new.digest:
+        return []
+    if old.name != new.name:
+        return [dict(op="replace", path=path, node=_to_json(new))]
+    patches = []
+    if old.props != new.props:
+        # only the (few) changed nodes are ever parsed
+        old_props, new_props = loads(old.props), loads(new.props)
+        patches.append(
+            dict(
+                op="props",
+                path=path,
+                set={
+                    k: v
+                    for k, v in new_props.items()
+                    if k not in old_props or old_props[k] != v
+                },
+                unset=[k for k in old_props if k not in new_props],
+            )
+        )
+    patches.extend(diff_trees(old.children, new.children, path))
+    return patches
+
+
+def _encode_children(
+    children: list["RenderTreeNode"], parts: list[bytes]
+) -> tuple[tuple[_Shape, ...], tuple[int, ...], int]:
+    """
+    Appends the encoded JSON of `children` to `parts`, to be joined once at the end.
+    Returns their shapes & digests, and the number of nodes.
+    """
+    shapes = []
+    digests = []
+    count = 0
+    for i, node in enumerate(children):
+        if i:
+            parts.append(b",")
+        props = dumps(node.props)
+        parts.append(_node_prefix(node.name))
+        parts.append(props)
+        parts.append(b',"children":[')
+        child_shapes, child_digests, child_count = _encode_children(
+            node.children, parts
+        )
+        parts.append(b"]}")
+        digest = hash((node.name, props, child_digests))
+        shapes.append(_Shape(node.name, props, child_shapes, digest))
+        digests.append(digest)
+        count += child_count + 1
+    return tuple(shapes), tuple(digests), count
+
+
+@lru_cache(maxsize=1024)
+def _node_prefix(name: str) -> bytes:
+    return b'{"name":' + dumps(name) + b',"props":'
+
+
+def _to_json(shape: _Shape) -> dict:
+    return dict(
+        name=shape.name,
+        props=loads(shape.props),
+        children=[_to_json(child) for child in shape.children],
+    )